@@ -0,0 +1,169 @@
+"""Alias → canonical project index learned from the LLM's `projects` and `alias` output.
+
+Every LLM response groups the names a tweet uses for a project (Bitcoin, BTC,
+₿); `AliasIndex.learn()` keeps those groups so later tweets can be resolved
+locally. Aliases are matched case-insensitively with an Aho-Corasick
+automaton, so `$BTC`, `@bitcoin` and `Bitcoin` in a text are all found in one
+pass over it, whatever the number of aliases.
+"""
+import json
+import os
+import time
+
+PREFIXES = "$@#"  # ticker, handle and hashtag prefixes, matched as part of the text around an alias
+
+def _fold(text):
+    # Lowercase without changing the length, so match offsets stay valid for text
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+def _key(alias):
+    return _fold(alias.strip().lstrip(PREFIXES))
+
+class AliasIndex:
+    """A persistent alias → canonical project map compiled into an Aho-Corasick matcher.
+
+    New aliases wait until `recompile_every` of them have been learned or
+    `recompile_seconds` have passed since the last compile; then the next
+    match adds them to the trie and rebuilds the failure links once. Until
+    then matching and lookup() use the last compiled automaton, so learning
+    from a stream of LLM responses doesn't rebuild it for every tweet.
+    """
+
+    def __init__(self, path=None, recompile_every=64, recompile_seconds=5.0):
+        self.path = path
+        self.recompile_every = recompile_every
+        self.recompile_seconds = recompile_seconds
+        self.aliases = {}  # folded alias -> canonical project name
+        # trie nodes: goto edges, failure link, and the lengths of the aliases ending here
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._matches = [[]]  # per node, the lengths of all aliases ending there, set by _compile
+        self._pending = set()  # aliases not in the trie yet
+        self._compiled_at = None
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                for alias, project in json.load(fp)["aliases"].items():
+                    self.add(alias, project)
+
+    def __len__(self):
+        return len(self.aliases)
+
+    def add(self, alias, project):
+        """Map alias (and the project name itself) to project."""
+        for name in (alias, project):
+            key = _key(name)
+            if not key or (len(key) < 2 and key.isascii()):
+                continue  # single letters would match everywhere
+            if key not in self.aliases:
+                self._pending.add(key)
+            self.aliases[key] = project
+
+    def _insert(self, key):
+        node = 0
+        for c in key:
+            if c not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][c] = len(self._goto) - 1
+            node = self._goto[node][c]
+        self._out[node].append(len(key))
+
+    def _compile(self):
+        for key in self._pending:
+            self._insert(key)
+        self._pending.clear()
+        # Breadth-first failure links; each node also inherits its failure node's outputs
+        outputs = [list(out) for out in self._out]
+        queue = []
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        for node in queue:
+            for c, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(c, 0)
+                outputs[child].extend(outputs[self._fail[child]])
+                queue.append(child)
+        self._matches = outputs
+        self._compiled_at = time.monotonic()
+
+    def learn(self, response):
+        """Add the alias groups of an LLM response (JSON string or dict).
+
+        Each group maps to the name from `projects` it contains, or to its
+        first name; projects outside any group map to themselves.
+        Returns the number of new aliases.
+        """
+        if isinstance(response, str):
+            try:
+                response = json.loads(response)
+            except json.JSONDecodeError:
+                return 0
+        if not isinstance(response, dict):
+            return 0
+        projects = [p for p in response.get("projects") or [] if isinstance(p, str)]
+        by_key = {_key(p): p for p in projects}
+        before = len(self.aliases)
+        for group in response.get("alias") or []:
+            group = [a for a in group if isinstance(a, str)] if isinstance(group, list) else []
+            if not group:
+                continue
+            project = next((by_key[_key(a)] for a in group if _key(a) in by_key), group[0])
+            for alias in group:
+                self.add(alias, project)
+        for project in projects:
+            if _key(project) not in self.aliases:
+                self.add(project, project)
+        return len(self.aliases) - before
+
+    def resolve(self, text):
+        """Return the aliases found in text, leftmost-longest and whole words only,
+        as dicts with alias, project, start and end."""
+        if self._pending and (self._compiled_at is None or len(self._pending) >= self.recompile_every
+                              or time.monotonic() - self._compiled_at >= self.recompile_seconds):
+            self._compile()
+        folded = _fold(text)
+        found = []
+        node = 0
+        for i, c in enumerate(folded):
+            while node and c not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(c, 0)
+            for length in self._matches[node]:
+                start, end = i + 1 - length, i + 1
+                if (start == 0 or not folded[start - 1].isalnum()) and (end == len(folded) or not folded[end].isalnum()):
+                    found.append((start, -end))
+        matches = []
+        last_end = 0
+        for start, end in sorted(found):
+            end = -end
+            if start < last_end:
+                continue
+            while start and text[start - 1] in PREFIXES:
+                start -= 1  # report $BTC and @bitcoin with their prefix
+            matches.append({
+                "alias": text[start:end],
+                "project": self.aliases[_key(text[start:end])],
+                "start": start,
+                "end": end,
+            })
+            last_end = end
+        return matches
+
+    def lookup(self, alias):
+        """Return the canonical project for one alias, or None if it is
+        unknown or not compiled yet."""
+        key = _key(alias)
+        return None if key in self._pending else self.aliases.get(key)
+
+    def save(self, path=None):
+        """Write the index to path (default: the path it was loaded from)."""
+        path = path or self.path
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fp:
+            json.dump({"aliases": self.aliases}, fp, ensure_ascii=False, indent=0, sort_keys=True)
+        os.replace(tmp, path)
@@ -0,0 +1,407 @@
+"""Crypto content analysis with the cryptoNER model and an LLM.
+
+Importing this module is cheap: the tokenizer, the NER pipeline and the
+OpenAI client are created on first use. Workers should share the
+process-wide instance from `get_analyzer()` and call `warmup()` at startup
+when they want the model loaded before serving traffic.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from cache import normalize
+
+model_name = "covalenthq/cryptoNER"
+llm_model = "gpt-4o-mini"
+
+BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+
+pre_process_prompt = """You are a crypto content analyzer. Your task is to determine if the input content is related to cryptocurrency and extract any mentioned project or token names.
+Please analyze the input content and return a JSON response with:
+- "low_score": boolean indicating if the content is low quality (no factual information or sentiment, e.g. only GM @project's name) or spam.
+- "crypto_related": boolean indicating if the content is about cryptocurrency.
+- "projects": list of strings containing any discussed project/token names that are primarily discussed or focused on within the text. Only include the projects that are the main subject of the conversation, and exclude any cryptocurrencies that are merely mentioned in passing or used as supplementary information. The goal is to identify the key crypto projects that the tweet is centered around. The result should be a well-known or official name of the project/token instead of any aliases.
+- "alias": list of lists of strings containing all aliases: identify and link all names, abbreviations, or aliases that refer to the same project or token. For example, if 'Bitcoin', 'BTC', and '₿' are used interchangeably, group them together as referring to the same cryptocurrency. The goal is to identify the key crypto projects that the tweet is centered around and consolidate all references to the same project/token.
+- "sentiment": string indicating the sentiment of the content, e.g. "positive", "negative", "neutral".
+Only include projects/tokens that are explicitly mentioned. If no specific projects are mentioned, return an empty list.
+Keep your response strictly in the requested JSON format without any additional text."""
+
+# Packed mode: several tweets per request, so the system prompt is paid once per batch
+packed_prompt = pre_process_prompt + """
+The input is a JSON array of objects with an "id" and a "text". Analyze each text separately and return a JSON array with one object per input, containing its "id" and the fields above, in the same order."""
+
+PACKED_FIELDS = ("low_score", "crypto_related", "projects", "alias", "sentiment")
+
+def estimate_tokens(text):
+    """Rough token count for the LLM, at about four characters per token."""
+    return len(text) // 4 + 1
+
+def parse_packed_response(content, ids):
+    """Split a packed response into {id: result JSON string}.
+
+    Only objects with a requested id and every field of the prompt are kept;
+    the ids missing from the result are the items to resubmit.
+    """
+    try:
+        results = json.loads(content.strip().removeprefix("```json").removesuffix("```"))
+    except (AttributeError, json.JSONDecodeError):
+        return {}
+    if isinstance(results, dict):
+        results = results.get("results", [])  # some models wrap the array in an object
+    if not isinstance(results, list):
+        return {}
+    parsed = {}
+    wanted = {str(id): id for id in ids}
+    for result in results:
+        if not isinstance(result, dict) or str(result.get("id")) not in wanted:
+            continue
+        if all(field in result for field in PACKED_FIELDS):
+            parsed[wanted[str(result["id"])]] = json.dumps({field: result[field] for field in PACKED_FIELDS})
+    return parsed
+
+def extract_entities(text, results):
+    """Turn the token-level pipeline output for a text into entities,
+    extending each B- token to the end of its word."""
+    entities = []
+    for item in results:
+        if item['entity'].startswith("B-"):
+            type = item['entity'].split("-")[1]
+            start = item['start']
+            end = item['end']
+            while end < len(text) and text[end] not in " ,.!?\n":
+                end += 1
+            entities.append({
+                "type": type,
+                "symbol": text[start:end],
+                "start": start,
+                "end": end,
+                "score": float(item['score']),
+            })
+    return entities
+
+def load_pipeline(backend="torch", tokenizer=None, onnx_dir="onnx-model"):
+    """Build the NER pipeline on the given CPU backend.
+
+    torch       the full-precision transformers model
+    torch-int8  the same model with int8 dynamic quantization of its Linear layers
+    onnx        the model exported to ONNX and run with ONNX Runtime
+    onnx-int8   the ONNX model with int8 dynamic quantization
+
+    The ONNX backends need `optimum[onnxruntime]` and cache the exported
+    model under onnx_dir.
+    """
+    from transformers import AutoModelForTokenClassification, AutoTokenizer, pipeline
+
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+    if backend == "torch":
+        model = model_name
+    elif backend == "torch-int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(
+            AutoModelForTokenClassification.from_pretrained(model_name),
+            {torch.nn.Linear},
+            dtype=torch.qint8,
+        )
+    elif backend in ("onnx", "onnx-int8"):
+        try:
+            from optimum.onnxruntime import ORTModelForTokenClassification, ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        except ImportError as e:
+            raise RuntimeError("The ONNX backends need `pip install optimum[onnxruntime]`") from e
+        if not os.path.exists(os.path.join(onnx_dir, "model.onnx")):
+            ORTModelForTokenClassification.from_pretrained(model_name, export=True).save_pretrained(onnx_dir)
+        if backend == "onnx":
+            model = ORTModelForTokenClassification.from_pretrained(onnx_dir)
+        else:
+            if not os.path.exists(os.path.join(onnx_dir, "model_quantized.onnx")):
+                quantizer = ORTQuantizer.from_pretrained(onnx_dir)
+                quantizer.quantize(
+                    save_dir=onnx_dir,
+                    quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False),
+                )
+            model = ORTModelForTokenClassification.from_pretrained(onnx_dir, file_name="model_quantized.onnx")
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+    return pipeline(
+        "token-classification",
+        model=model,
+        tokenizer=tokenizer,
+        aggregation_strategy="none"  # Don't aggregate so we can see individual tokens
+    )
+
+class CryptoAnalyzer:
+    """NER and LLM analysis of crypto content with lazily created models.
+
+    The tokenizer and NER pipeline are loaded the first time NER runs, and the
+    OpenAI client is created the first time the LLM is called, so a worker
+    that only uses the LLM never loads the model.
+    """
+
+    def __init__(self, backend=None, api_key=None, base_url=None, min_entities=1, min_score=0.5,
+                 aliases=None, cache=None):
+        self.backend = backend or os.getenv("CRYPTO_NER_BACKEND", "torch")
+        # Cascade thresholds: analyze() calls the LLM only for texts with at least
+        # min_entities entities scored min_score or higher
+        self.min_entities = min_entities
+        self.min_score = min_score
+        self.llm_calls = 0
+        self.llm_skipped = 0
+        # An aliases.AliasIndex tried before the LLM, and taught by its responses
+        self.aliases = aliases
+        self.alias_hits = 0
+        self.cache = None
+        if cache is not None:
+            self.use_cache(cache)
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "your_api_key")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._pipe = None
+        self._client = None
+        self._async_client = None
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return self._tokenizer
+
+    @property
+    def pipe(self):
+        if self._pipe is None:
+            tokenizer = self.tokenizer
+            with self._lock:
+                if self._pipe is None:
+                    self._pipe = load_pipeline(self.backend, tokenizer)
+        return self._pipe
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    from openai import AsyncOpenAI
+                    # Callers such as the streaming pipeline do their own retries
+                    self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._async_client
+
+    def warmup(self, ner=True, llm=True):
+        """Load the NER model (running it once) and create the LLM client now
+        rather than on the first request."""
+        if ner:
+            self.pipe("GM $BTC")
+        if llm:
+            self.client
+
+    @property
+    def ner_version(self):
+        return f"{model_name}/{self.backend}"
+
+    @property
+    def llm_version(self):
+        # packed_prompt too, since packed results are cached under the same version
+        prompts = (pre_process_prompt + "\0" + packed_prompt).encode("utf-8")
+        return f"{llm_model}/{hashlib.sha256(prompts).hexdigest()[:16]}"
+
+    def use_cache(self, cache):
+        """Cache NER and LLM outputs in a cache.AnalysisCache.
+
+        Entries of other models, backends and prompt versions stay in the
+        file for workers that use them, and age out through its eviction.
+        """
+        self.cache = cache
+
+    def _cached_ner(self, text):
+        if self.cache is None:
+            return None
+        entities = self.cache.get("ner", self.ner_version, text)
+        return None if entities is None else json.loads(entities)
+
+    def _cache_ner(self, text, entities):
+        if self.cache is not None:
+            self.cache.put("ner", self.ner_version, text, json.dumps(entities))
+
+    def cached_llm(self, text):
+        """Return the cached LLM response for text, or None."""
+        if self.cache is None:
+            return None
+        return self.cache.get("llm", self.llm_version, normalize(text))
+
+    def cache_llm(self, text, response):
+        """Store the LLM response for text in the cache, if any."""
+        if self.cache is not None:
+            self.cache.put("llm", self.llm_version, normalize(text), response)
+
+    def ner(self, text):
+        """Return the entities the NER model finds in text."""
+        entities = self._cached_ner(text)
+        if entities is None:
+            entities = extract_entities(text, self.pipe(text))
+            self._cache_ner(text, entities)
+        return entities
+
+    def ner_batch(self, texts, batch_size=32, bucket_batches=16):
+        """Run NER over a stream of texts and yield their entity lists in input order.
+
+        Texts are read in windows of `bucket_batches` batches. Each window is sorted
+        by token length before batching, so texts of similar length are padded
+        together and short tweets don't pay for the longest one in the batch.
+        Texts found in the cache skip the model.
+        """
+        texts = iter(texts)
+        while True:
+            window = [text for _, text in zip(range(batch_size * bucket_batches), texts)]
+            if not window:
+                return
+            entities = [self._cached_ner(text) for text in window]
+            misses = [j for j, cached in enumerate(entities) if cached is None]
+            if misses:
+                input_ids = self.tokenizer([window[j] for j in misses], add_special_tokens=False)["input_ids"]
+                lengths = dict(zip(misses, map(len, input_ids)))
+                misses.sort(key=lengths.__getitem__)
+            for i in range(0, len(misses), batch_size):
+                bucket = misses[i:i + batch_size]
+                results = self.pipe([window[j] for j in bucket], batch_size=batch_size)
+                for j, result in zip(bucket, results):
+                    entities[j] = extract_entities(window[j], result)
+                    self._cache_ner(window[j], entities[j])
+            yield from entities
+
+    def llm(self, text):
+        """Return the LLM's JSON analysis of text, as the raw response string."""
+        cached = self.cached_llm(text)
+        if cached is not None:
+            return cached
+        response = self.client.chat.completions.create(
+            model=llm_model,
+            messages=[
+                {"role": "system", "content": pre_process_prompt},
+                {"role": "user", "content": text},
+            ],
+        )
+        content = response.choices[0].message.content
+        self.cache_llm(text, content)
+        return content
+
+    async def llm_async(self, text):
+        """Same as llm(), with the async OpenAI client."""
+        cached = self.cached_llm(text)
+        if cached is not None:
+            return cached
+        response = await self.async_client.chat.completions.create(
+            model=llm_model,
+            messages=[
+                {"role": "system", "content": pre_process_prompt},
+                {"role": "user", "content": text},
+            ],
+        )
+        content = response.choices[0].message.content
+        self.cache_llm(text, content)
+        return content
+
+    def _packed_messages(self, items):
+        return [
+            {"role": "system", "content": packed_prompt},
+            {"role": "user", "content": json.dumps([{"id": id, "text": text} for id, text in items], ensure_ascii=False)},
+        ]
+
+    def llm_packed(self, items):
+        """Analyze several (id, text) items in one request.
+
+        Returns ({id: response string}, truncated) with only the items whose
+        result parsed; truncated is set when the reply hit the output limit.
+        """
+        response = self.client.chat.completions.create(model=llm_model, messages=self._packed_messages(items))
+        choice = response.choices[0]
+        return parse_packed_response(choice.message.content, [id for id, _ in items]), choice.finish_reason == "length"
+
+    async def llm_packed_async(self, items):
+        """Same as llm_packed(), with the async OpenAI client."""
+        response = await self.async_client.chat.completions.create(model=llm_model, messages=self._packed_messages(items))
+        choice = response.choices[0]
+        return parse_packed_response(choice.message.content, [id for id, _ in items]), choice.finish_reason == "length"
+
+    def should_call_llm(self, entities):
+        """Whether the NER entities of a text pass the cascade thresholds."""
+        confident = [e for e in entities if e["score"] >= self.min_score]
+        return len(confident) >= self.min_entities
+
+    def analyze(self, text, entities=None):
+        """Run NER on text, then the LLM only if the entities pass the cascade thresholds.
+
+        Returns {"entities": [...], "llm": response string or None, "skipped": bool}.
+        Spam and "GM" tweets with no confident entities never reach the LLM;
+        `llm_calls` and `llm_skipped` count how often each path was taken.
+        Pass entities when NER has already been run on the text.
+
+        With an alias index, texts whose confident entities are all known
+        aliases are resolved locally instead: the result has "projects" from
+        the index and no LLM response. Every LLM response is learned by the index.
+        """
+        if entities is None:
+            entities = self.ner(text)
+        result = self.cascade(text, entities)
+        if result is None:
+            response = self.llm(text)
+            self.learn(response)
+            result = {"entities": entities, "llm": response, "skipped": False}
+        return result
+
+    def cascade(self, text, entities):
+        """Return the analyze() result for text if it needs no LLM call, else None
+        (counting it as an LLM call, which the caller then makes)."""
+        if not self.should_call_llm(entities):
+            with self._lock:
+                self.llm_skipped += 1
+            return {"entities": entities, "llm": None, "skipped": True}
+        if self.aliases is not None:
+            confident = [e for e in entities if e["score"] >= self.min_score]
+            if confident and all(self.aliases.lookup(e["symbol"]) for e in confident):
+                projects = sorted({match["project"] for match in self.aliases.resolve(text)})
+                with self._lock:
+                    self.alias_hits += 1
+                return {"entities": entities, "llm": None, "skipped": False, "projects": projects}
+        with self._lock:
+            self.llm_calls += 1
+        return None
+
+    def learn(self, response):
+        """Teach the alias index, if any, from an LLM response."""
+        if self.aliases is not None:
+            with self._lock:
+                self.aliases.learn(response)
+
+    def cascade_stats(self):
+        """Return how many texts analyze() sent to the LLM, resolved from aliases and skipped."""
+        total = self.llm_calls + self.alias_hits + self.llm_skipped
+        return {
+            "llm_calls": self.llm_calls,
+            "alias_hits": self.alias_hits,
+            "llm_skipped": self.llm_skipped,
+            "skip_rate": self.llm_skipped / total if total else None,
+        }
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+def get_analyzer():
+    """Return the process-wide analyzer, creating it on first call."""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = CryptoAnalyzer()
+    return _analyzer
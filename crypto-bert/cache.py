@@ -0,0 +1,104 @@
+"""Disk cache of NER and LLM outputs, shared across runs and worker processes.
+
+Entries live in one SQLite file, keyed by a hash of the output kind, a
+version string and the text. The analyzer builds the versions from the model
+names, the NER backend and a hash of the prompts, so changing any of them
+makes old entries unreachable. Entries of other versions are left for the
+workers still using them, and expire through the TTL and size eviction.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+
+EVICT_EVERY = 1000  # puts between size checks
+
+def normalize(text):
+    """NFC-normalize text and collapse its whitespace, for cache keys of LLM outputs."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class AnalysisCache:
+    """A SQLite cache of string values with a TTL and a maximum number of entries.
+
+    Expired entries count as misses and are deleted when met. Past
+    `max_entries`, the least recently used entries are deleted.
+    """
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=1_000_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = {}
+        self.misses = {}
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key BLOB PRIMARY KEY,
+            kind TEXT NOT NULL,
+            version TEXT NOT NULL,
+            value TEXT NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    @staticmethod
+    def key(kind, version, text):
+        return hashlib.sha256("\0".join((kind, version, text)).encode("utf-8")).digest()
+
+    def get(self, kind, version, text):
+        """Return the cached value, or None."""
+        key = self.key(kind, version, text)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] < now - self.ttl:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                return None
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            return row[0]
+
+    def put(self, kind, version, text, value):
+        """Store value for text."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(kind, version, text), kind, version, value, now, now),
+            )
+            self._puts += 1
+            if self._puts % EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        excess = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)", (excess,))
+
+    def evict(self):
+        """Delete expired entries and the least recently used ones past max_entries."""
+        with self._lock:
+            self._evict(time.time())
+
+    def stats(self):
+        """Return the hit and miss counts per kind, and the number of entries."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "cache_entries": entries,
+            **{f"cache_{kind}_hits": self.hits.get(kind, 0) for kind in sorted(self.hits.keys() | self.misses.keys())},
+            **{f"cache_{kind}_misses": self.misses.get(kind, 0) for kind in sorted(self.hits.keys() | self.misses.keys())},
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,122 @@
+"""Near-duplicate detection for tweets with 64-bit SimHash signatures.
+
+Retweets, shills and copy-paste spam differ only in links, handles or a few
+words, so their SimHash signatures are a few bits apart. `NearDuplicateIndex`
+finds an earlier signature within `max_distance` bits by splitting each
+signature into `max_distance + 1` bands: two signatures that close must agree
+exactly on at least one band, so only texts sharing a band are compared.
+"""
+import hashlib
+import re
+import time
+from collections import deque
+
+SIGNATURE_BITS = 64
+
+_retweet = re.compile(r"^rt @\w+:\s*")
+_url = re.compile(r"https?://\S+")
+_word = re.compile(r"[$#@]?\w+")
+
+def normalize(text):
+    """Lowercase text and drop the retweet prefix and links, which vary between copies."""
+    text = _retweet.sub("", text.lower())
+    return _url.sub("", text)
+
+def simhash(text, shingle=3):
+    """Return the 64-bit SimHash of text, built from overlapping word shingles."""
+    words = _word.findall(normalize(text))
+    features = [" ".join(words[i:i + shingle]) for i in range(max(1, len(words) - shingle + 1))]
+    votes = [0] * SIGNATURE_BITS
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIGNATURE_BITS):
+            votes[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, vote in enumerate(votes) if vote > 0)
+
+class NearDuplicateIndex:
+    """A sliding window of recent signatures, each mapped to a value.
+
+    Entries older than `window` seconds are dropped, and the oldest entries
+    are dropped once there are more than `max_size`, so memory stays bounded
+    on an endless stream.
+    """
+
+    def __init__(self, max_distance=3, window=3600.0, max_size=100_000):
+        self.max_distance = max_distance
+        self.window = window
+        self.max_size = max_size
+        self.bands = max_distance + 1
+        self.band_bits = -(-SIGNATURE_BITS // self.bands)
+        self.tables = [{} for _ in range(self.bands)]  # band value -> entries with that band
+        self.entries = deque()  # [timestamp, signature, value], oldest first
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _band_keys(self, signature):
+        mask = (1 << self.band_bits) - 1
+        return [signature >> (i * self.band_bits) & mask for i in range(self.bands)]
+
+    def _evict(self, now):
+        while self.entries and (len(self.entries) > self.max_size or self.entries[0][0] < now - self.window):
+            entry = self.entries.popleft()
+            for table, key in zip(self.tables, self._band_keys(entry[1])):
+                bucket = table[key]
+                bucket.remove(entry)
+                if not bucket:
+                    del table[key]
+
+    def find(self, signature, now=None):
+        """Return the value of the closest signature within max_distance, or None."""
+        self._evict(time.time() if now is None else now)
+        best = None
+        for table, key in zip(self.tables, self._band_keys(signature)):
+            for entry in table.get(key, ()):
+                distance = (entry[1] ^ signature).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, entry[2])
+        return None if best is None else best[1]
+
+    def add(self, signature, value, now=None):
+        """Index signature with value at time now (default: the current time)."""
+        now = time.time() if now is None else now
+        entry = [now, signature, value]
+        self.entries.append(entry)
+        for table, key in zip(self.tables, self._band_keys(signature)):
+            table.setdefault(key, []).append(entry)
+        self._evict(now)
+
+class Deduplicator:
+    """Clusters a stream of texts so each cluster is analyzed once.
+
+    `assign()` returns the cluster of a text and whether the text leads it.
+    The caller analyzes leaders only, stores the result on the cluster and
+    hands it to every later member.
+    """
+
+    def __init__(self, max_distance=3, window=3600.0, max_size=100_000):
+        self.index = NearDuplicateIndex(max_distance, window, max_size)
+        self.texts = 0
+        self.clusters = 0
+
+    def assign(self, text, now=None):
+        """Return (cluster, is_leader) for text; a cluster is a dict with a "result" key."""
+        self.texts += 1
+        signature = simhash(text)
+        cluster = self.index.find(signature, now)
+        if cluster is not None:
+            cluster["members"] += 1
+            return cluster, False
+        self.clusters += 1
+        cluster = {"id": self.clusters, "members": 1, "result": None}
+        self.index.add(signature, cluster, now)
+        return cluster, True
+
+    def stats(self):
+        """Return how many texts were seen and how many needed analysis."""
+        return {
+            "texts": self.texts,
+            "clusters": self.clusters,
+            "duplicates": self.texts - self.clusters,
+            "indexed": len(self.index),
+        }
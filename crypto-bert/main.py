@@ -1,18 +1,16 @@
-# Use a pipeline as a high-level helper
-from transformers import pipeline, AutoTokenizer
-from openai import OpenAI
-
-# Initialize the pipeline and tokenizer
-model_name = "covalenthq/cryptoNER"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-pipe = pipeline(
-    "token-classification", 
-    model=model_name,
-    tokenizer=tokenizer,
-    aggregation_strategy="none"  # Don't aggregate so we can see individual tokens
-)
-
-client = OpenAI(api_key="your_api_key")
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import deque
+
+from aliases import AliasIndex
+from analyzer import BACKENDS, CryptoAnalyzer, get_analyzer
+from cache import AnalysisCache
+from dedup import Deduplicator
+from pipeline import Pipeline
 
 # Test text with various potential entities
 # https://x.com/Remy_Ryy/status/1887272002253099130
@@ -44,42 +42,249 @@ It's conceptually similar to
 But this is different — Agent $COOKIE & "minions" are trained for crypto and DeFAI
 """
 
-pre_process_prompt = """You are a crypto content analyzer. Your task is to determine if the input content is related to cryptocurrency and extract any mentioned project or token names.
-Please analyze the input content and return a JSON response with:
-- "low_score": boolean indicating if the content is low quality (no factual information or sentiment, e.g. only GM @project's name) or spam.
-- "crypto_related": boolean indicating if the content is about cryptocurrency.
-- "projects": list of strings containing any discussed project/token names that are primarily discussed or focused on within the text. Only include the projects that are the main subject of the conversation, and exclude any cryptocurrencies that are merely mentioned in passing or used as supplementary information. The goal is to identify the key crypto projects that the tweet is centered around. The result should be a well-known or official name of the project/token instead of any aliases.
-- "alias": list of lists of strings containing all aliases: identify and link all names, abbreviations, or aliases that refer to the same project or token. For example, if 'Bitcoin', 'BTC', and '₿' are used interchangeably, group them together as referring to the same cryptocurrency. The goal is to identify the key crypto projects that the tweet is centered around and consolidate all references to the same project/token.
-- "sentiment": string indicating the sentiment of the content, e.g. "positive", "negative", "neutral".
-Only include projects/tokens that are explicitly mentioned. If no specific projects are mentioned, return an empty list.
-Keep your response strictly in the requested JSON format without any additional text."""
-
 def use_ner(text):
     print("\nUse NER:")
     print("-" * 50)
-    results = pipe(text)
-    for i, item in enumerate(results):
-        if item['entity'].startswith("B-"):
-            type = item['entity'].split("-")[1]
-            start = item['start']
-            end = item['end']
-            while text[end] not in " ,.!?\n" and end < len(text):
-                end += 1
-            symbol = text[start:end]
-            print(f"{type}: {symbol}")
+    for entity in get_analyzer().ner(text):
+        print(f"{entity['type']}: {entity['symbol']}")
 
 def use_llm(text):
     print("\nUse LLM:")
     print("-" * 50)
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": pre_process_prompt},
-            {"role": "user", "content": text},
-        ],
-    )
-    print(response.choices[0].message.content)
-
-print(text)
-use_ner(text)
-use_llm(text)
+    print(get_analyzer().llm(text))
+
+def read_jsonl(fp, text_field="text"):
+    """Yield records from a JSONL stream; plain-text lines become {text_field: line}."""
+    for line in fp:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = None
+        if not isinstance(record, dict):
+            record = {text_field: line}
+        yield record
+
+def run_ner_batch(args):
+    """Tag every text from the input with NER and write one JSONL line per text.
+
+    With --cascade, texts whose entities pass the thresholds are also sent to
+    the LLM and its response is added to their line. A record without the
+    text field gets an "error" line instead of stopping the run.
+    """
+    analyzer = CryptoAnalyzer(backend=args.backend) if args.backend else get_analyzer()
+    analyzer.min_entities = args.min_entities
+    analyzer.min_score = args.min_score
+    if args.aliases:
+        analyzer.aliases = AliasIndex(args.aliases)
+    if args.cache:
+        analyzer.use_cache(AnalysisCache(args.cache, args.cache_ttl))
+    input_fp = open(args.input) if args.input != "-" else sys.stdin
+    output_fp = open(args.output, "w") if args.output != "-" else sys.stdout
+
+    # With --dedup only the first text of each near-duplicate cluster is analyzed;
+    # later members get its result. Timestamps come from --time-field when given.
+    dedup = Deduplicator(args.dedup_distance, args.dedup_window) if args.dedup else None
+
+    # Records wait here, with their cluster, until ner_batch yields the entities
+    # of their leader; members always follow their leader, so order is kept.
+    # Records without text wait as members of no cluster.
+    pending = deque()
+    def texts():
+        for record in read_jsonl(input_fp, args.text_field):
+            if args.text_field not in record:
+                pending.append((record, None, False))
+                continue
+            if dedup is None:
+                pending.append((record, None, True))
+                yield record[args.text_field]
+                continue
+            now = record.get(args.time_field) if args.time_field else None
+            cluster, leader = dedup.assign(record[args.text_field], now)
+            pending.append((record, cluster, leader))
+            if leader:
+                yield record[args.text_field]
+
+    def write(record, output, cluster):
+        if cluster is not None:
+            output = {**output, "cluster": cluster["id"]}
+        if "id" in record:
+            output = {"id": record["id"], **output}
+        output_fp.write(json.dumps(output, ensure_ascii=False) + "\n")
+
+    def write_members():
+        # members queued before the next leader already have their leader's result
+        nonlocal count, errors
+        while pending and not pending[0][2]:
+            record, cluster, _ = pending.popleft()
+            if cluster is None:
+                write(record, {"error": f"KeyError: {args.text_field!r}"}, None)
+                errors += 1
+            else:
+                write(record, cluster["result"], cluster)
+                count += 1
+
+    count = errors = 0
+    start = time.perf_counter()
+    for entities in analyzer.ner_batch(texts(), args.batch_size, args.bucket_batches):
+        write_members()
+        record, cluster, _ = pending.popleft()
+        output = {"entities": entities}
+        if args.cascade:
+            output = analyzer.analyze(record[args.text_field], entities)
+        if cluster is not None:
+            cluster["result"] = output
+        write(record, output, cluster)
+        count += 1
+    write_members()
+    output_fp.flush()
+    elapsed = time.perf_counter() - start
+    print(f"Tagged {count} texts in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.1f} texts/s)",
+          file=sys.stderr)
+    if errors:
+        print(f"Skipped {errors} records without a {args.text_field!r} field", file=sys.stderr)
+    if args.cascade:
+        print(json.dumps(analyzer.cascade_stats()), file=sys.stderr)
+    if dedup is not None:
+        print(json.dumps(dedup.stats()), file=sys.stderr)
+    if args.cache:
+        print(json.dumps(analyzer.cache.stats()), file=sys.stderr)
+    if args.aliases:
+        analyzer.aliases.save()
+
+def run_pipeline(args):
+    """Stream records through NER and the LLM cascade and write JSONL results."""
+    analyzer = CryptoAnalyzer(backend=args.backend, base_url=args.base_url,
+                              min_entities=args.min_entities, min_score=args.min_score)
+    if args.aliases:
+        analyzer.aliases = AliasIndex(args.aliases)
+    if args.cache:
+        analyzer.use_cache(AnalysisCache(args.cache, args.cache_ttl))
+    analyzer.warmup()
+    input_fp = open(args.input) if args.input != "-" else sys.stdin
+    output_fp = open(args.output, "w") if args.output != "-" else sys.stdout
+    pipeline = Pipeline(analyzer, args.text_field, args.ner_workers, args.llm_concurrency,
+                        args.max_pending, not args.unordered, args.retries, args.packed, args.max_tokens)
+    stats = asyncio.run(pipeline.run(read_jsonl(input_fp, args.text_field), output_fp))
+    if args.aliases:
+        analyzer.aliases.save()
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+
+def compare_backends(texts, backends, batch_size=32):
+    """Run each backend over the same texts and compare it with the torch pipeline.
+
+    Agreement is measured on (type, symbol, start) entities: precision and
+    recall against torch, and the share of texts with exactly the same entities.
+    """
+    def run(analyzer):
+        analyzer.warmup(llm=False)
+        start = time.perf_counter()
+        latencies = []
+        results = []
+        for text in texts:
+            text_start = time.perf_counter()
+            results.append(analyzer.ner(text))
+            latencies.append(time.perf_counter() - text_start)
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in analyzer.ner_batch(texts, batch_size):
+            pass
+        batched = time.perf_counter() - start
+        return results, {
+            "latency_p50_ms": statistics.median(latencies) * 1000,
+            "texts_per_second": len(texts) / single if single else None,
+            "batched_texts_per_second": len(texts) / batched if batched else None,
+        }
+
+    def entity_set(entities):
+        return {(e["type"], e["symbol"], e["start"]) for e in entities}
+
+    reference, report = run(CryptoAnalyzer(backend="torch"))
+    reports = {"torch": report}
+    for name in backends:
+        if name == "torch":
+            continue
+        results, report = run(CryptoAnalyzer(backend=name))
+        matched = expected = found = exact = 0
+        for ref, res in zip(reference, results):
+            ref, res = entity_set(ref), entity_set(res)
+            matched += len(ref & res)
+            expected += len(ref)
+            found += len(res)
+            exact += ref == res
+        report["precision"] = matched / found if found else 1.0
+        report["recall"] = matched / expected if expected else 1.0
+        report["exact_match"] = exact / len(texts) if texts else None
+        reports[name] = report
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crypto content analysis with NER and an LLM")
+    subparsers = parser.add_subparsers(dest="command")
+    ner_batch = subparsers.add_parser("ner-batch", help="tag a stream of texts with NER")
+    ner_batch.add_argument("--input", default="-", help="JSONL file with a text field per line, or - for stdin")
+    ner_batch.add_argument("--output", default="-", help="JSONL file for the entities, or - for stdout")
+    ner_batch.add_argument("--text-field", default="text", help="field of each record holding the text")
+    ner_batch.add_argument("--batch-size", type=int, default=32, help="texts per model batch")
+    ner_batch.add_argument("--bucket-batches", type=int, default=16,
+                           help="batches per length-sorting window")
+    ner_batch.add_argument("--backend", choices=BACKENDS, help="NER backend (default: $CRYPTO_NER_BACKEND or torch)")
+    ner_batch.add_argument("--cascade", action="store_true",
+                           help="also run the LLM on texts whose entities pass the thresholds")
+    ner_batch.add_argument("--min-entities", type=int, default=1,
+                           help="entities a text needs before the cascade calls the LLM")
+    ner_batch.add_argument("--min-score", type=float, default=0.5,
+                           help="NER score an entity needs to count towards --min-entities")
+    ner_batch.add_argument("--aliases", help="alias index file the cascade resolves known projects from and updates")
+    ner_batch.add_argument("--cache", help="SQLite file caching NER and LLM outputs across runs")
+    ner_batch.add_argument("--cache-ttl", type=float, default=30 * 24 * 3600, help="seconds a cached output stays valid")
+    ner_batch.add_argument("--dedup", action="store_true",
+                           help="analyze each cluster of near-duplicate texts once")
+    ner_batch.add_argument("--dedup-distance", type=int, default=3,
+                           help="SimHash bits two texts may differ by and still be duplicates")
+    ner_batch.add_argument("--dedup-window", type=float, default=3600.0,
+                           help="seconds a text stays in the duplicate index")
+    ner_batch.add_argument("--time-field", help="numeric timestamp field of each record (default: arrival time)")
+    stream = subparsers.add_parser("pipeline", help="stream texts through NER and the LLM cascade concurrently")
+    stream.add_argument("--input", default="-", help="JSONL file with a text field per line, or - for stdin")
+    stream.add_argument("--output", default="-", help="JSONL file for the results, or - for stdout")
+    stream.add_argument("--text-field", default="text", help="field of each record holding the text")
+    stream.add_argument("--backend", choices=BACKENDS, help="NER backend (default: $CRYPTO_NER_BACKEND or torch)")
+    stream.add_argument("--base-url", help="OpenAI API base URL, e.g. a mock_llm.py server (default: $OPENAI_BASE_URL)")
+    stream.add_argument("--ner-workers", type=int, default=4, help="threads running NER")
+    stream.add_argument("--llm-concurrency", type=int, default=16, help="LLM requests in flight at once")
+    stream.add_argument("--max-pending", type=int, default=256, help="records in flight before reading pauses")
+    stream.add_argument("--retries", type=int, default=5, help="retries of a rate-limited or failed LLM request")
+    stream.add_argument("--packed", type=int, default=0,
+                        help="pack up to this many texts into one LLM request (default: one text per request)")
+    stream.add_argument("--max-tokens", type=int, default=8000,
+                        help="token budget of a packed request, prompt and expected reply included")
+    stream.add_argument("--unordered", action="store_true", help="write results as they finish, not in input order")
+    stream.add_argument("--min-entities", type=int, default=1,
+                        help="entities a text needs before the cascade calls the LLM")
+    stream.add_argument("--min-score", type=float, default=0.5,
+                        help="NER score an entity needs to count towards --min-entities")
+    stream.add_argument("--aliases", help="alias index file the cascade resolves known projects from and updates")
+    stream.add_argument("--cache", help="SQLite file caching NER and LLM outputs across runs")
+    stream.add_argument("--cache-ttl", type=float, default=30 * 24 * 3600, help="seconds a cached output stays valid")
+    compare = subparsers.add_parser("compare-backends", help="check NER backends for parity and speed")
+    compare.add_argument("--input", required=True, help="JSONL file with the sample texts")
+    compare.add_argument("--text-field", default="text", help="field of each record holding the text")
+    compare.add_argument("--limit", type=int, default=200, help="number of sample texts")
+    compare.add_argument("--backends", nargs="+", choices=BACKENDS, default=["torch-int8", "onnx", "onnx-int8"])
+    args = parser.parse_args()
+
+    if args.command == "ner-batch":
+        run_ner_batch(args)
+    elif args.command == "pipeline":
+        run_pipeline(args)
+    elif args.command == "compare-backends":
+        with open(args.input) as fp:
+            sample = [record[args.text_field] for _, record in zip(range(args.limit), read_jsonl(fp, args.text_field))]
+        print(json.dumps(compare_backends(sample, args.backends), indent=2))
+    else:
+        print(text)
+        use_ner(text)
+        use_llm(text)
@@ -0,0 +1,119 @@
+"""A local stand-in for the OpenAI chat completions endpoint, for offline benchmarks.
+
+Answers every POST with a completion in the format `pre_process_prompt` asks
+for, listing the $TICKERs of the last message as projects, after a
+configurable latency, and packed requests with an array of results. A share
+of requests can fail with 429, and of packed items be dropped, to exercise
+retries and resubmission. Point the pipeline at it with --base-url http://127.0.0.1:8000/v1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+_ticker = re.compile(r"\$([A-Za-z][A-Za-z0-9]{1,9})\b")
+
+def analyze(text):
+    projects = list(dict.fromkeys(match.upper() for match in _ticker.findall(text)))
+    return {
+        "low_score": not projects,
+        "crypto_related": bool(projects),
+        "projects": projects,
+        "alias": [[project, f"${project}"] for project in projects],
+        "sentiment": "neutral",
+    }
+
+def completion(request, drop_rate=0.0):
+    """Build a chat completion response for a parsed request body.
+
+    A packed request (a JSON array of {id, text}) gets a JSON array of
+    results, each left out with probability drop_rate.
+    """
+    text = request["messages"][-1]["content"]
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        items = None
+    if isinstance(items, list):
+        content = json.dumps([{"id": item["id"], **analyze(item["text"])}
+                              for item in items if random.random() >= drop_rate])
+    else:
+        content = json.dumps(analyze(text))
+    prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-mock-{random.getrandbits(64):016x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "mock"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+class MockLLMServer:
+    """Minimal HTTP/1.1 server with keep-alive, enough for the OpenAI client."""
+
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, drop_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.requests = 0
+
+    async def _respond(self, body):
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+        try:
+            return 200, completion(json.loads(body), self.drop_rate)
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            return 400, {"error": {"message": f"Bad request: {e}", "type": "invalid_request_error"}}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while request_line := await reader.readline():
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                if request_line.split()[0] == b"POST":
+                    status, response = await self._respond(body)
+                else:
+                    status, response = 404, {"error": {"message": "Not found"}}
+                payload = json.dumps(response).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="standard deviation of the response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="share of items left out of packed replies")
+    args = parser.parse_args()
+    print(f"Mock LLM on http://{args.host}:{args.port}/v1")
+    asyncio.run(MockLLMServer(args.latency, args.jitter, args.error_rate, args.drop_rate).serve(args.host, args.port))
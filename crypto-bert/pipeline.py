@@ -0,0 +1,269 @@
+"""Streaming analysis of tweets: JSONL records in, one JSONL result per record out.
+
+NER runs in a thread pool, and the texts that pass the cascade go to the LLM
+through the async OpenAI client, at most `llm_concurrency` requests at a time,
+retried with jittered exponential backoff on rate limits, connection errors
+and 5xx responses. At most `max_pending` records are in flight: the reader
+waits for a result to be written before taking the next record, so a slow
+LLM slows the reader down instead of filling memory.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from analyzer import estimate_tokens, packed_prompt
+
+def _retryable(error):
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+async def call_with_retry(call, *args, retries=5, base_delay=0.5, max_delay=30.0):
+    """Await call(*args), retrying retryable OpenAI errors up to `retries` times.
+
+    The delay before retry n is drawn uniformly from [0, base_delay * 2**n],
+    capped at max_delay, so clients that failed together don't retry together.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await call(*args)
+        except Exception as e:
+            if attempt == retries or not _retryable(e):
+                raise
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+
+class PackedLLM:
+    """Packs the texts submitted to it into shared LLM requests.
+
+    A request is formed when one of the LLM slots is free; texts queued by
+    then (after waiting up to `linger` seconds for the batch to fill) go
+    together, at most `size` of them and within `max_tokens` counting the
+    prompt, the texts and `output_tokens` of reply per text. `size` adapts
+    to the model: it is halved when a reply is truncated or mostly fails to
+    parse, and grows by one after a clean reply, up to `max_items`.
+    Texts missing from a reply are resubmitted in a later batch, and sent
+    alone once they have failed `max_attempts` times.
+    """
+
+    def __init__(self, analyzer, llm_slots, max_items=20, max_tokens=8000, output_tokens=60,
+                 linger=0.05, max_attempts=3, retries=5):
+        self.analyzer = analyzer
+        self.llm_slots = llm_slots
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.output_tokens = output_tokens
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.retries = retries
+        self.size = max_items
+        self.queue = deque()  # [id, text, future, failed attempts]
+        self.requests = self.packed_items = self.resubmitted = self.truncated = 0
+        self._next_id = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._sending = set()
+
+    async def submit(self, text):
+        """Return the LLM response for text, from the cache or sent in a packed request."""
+        cached = self.analyzer.cached_llm(text)
+        if cached is not None:
+            return cached
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append([self._next_id, text, future, 0])
+        self._next_id += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return await future
+
+    def _take(self):
+        if self.queue[0][3] >= self.max_attempts:
+            return [self.queue.popleft()]
+        budget = self.max_tokens - estimate_tokens(packed_prompt)
+        batch = []
+        while self.queue and len(batch) < self.size and self.queue[0][3] < self.max_attempts:
+            cost = estimate_tokens(self.queue[0][1]) + self.output_tokens + 8  # 8 for the id and JSON around the text
+            if batch and cost > budget:
+                break
+            budget -= cost
+            batch.append(self.queue.popleft())
+        return batch
+
+    async def _run(self):
+        while True:
+            while not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await self.llm_slots.acquire()
+            if len(self.queue) < self.size:
+                await asyncio.sleep(self.linger)
+            if not self.queue:
+                self.llm_slots.release()
+                continue
+            task = asyncio.create_task(self._send(self._take()))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch):
+        try:
+            if len(batch) == 1 and batch[0][3] >= self.max_attempts:
+                response = await call_with_retry(self.analyzer.llm_async, batch[0][1], retries=self.retries)
+                parsed, truncated = {batch[0][0]: response}, False
+            else:
+                self.requests += 1
+                self.packed_items += len(batch)
+                parsed, truncated = await call_with_retry(
+                    self.analyzer.llm_packed_async, [(id, text) for id, text, _, _ in batch], retries=self.retries)
+        except Exception as e:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.llm_slots.release()
+
+        failed = []
+        for item in batch:
+            if item[0] in parsed:
+                self.analyzer.cache_llm(item[1], parsed[item[0]])
+                if not item[2].done():
+                    item[2].set_result(parsed[item[0]])
+            else:
+                failed.append(item)
+        if truncated or len(failed) > len(batch) // 2:
+            self.size = max(1, self.size // 2)
+        elif not failed:
+            self.size = min(self.max_items, self.size + 1)
+        self.truncated += truncated
+        self.resubmitted += len(failed)
+        for item in reversed(failed):
+            item[3] += 1
+            self.queue.appendleft(item)
+        if failed:
+            self._wakeup.set()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def stats(self):
+        """Return how many requests carried how many texts, and how many were resubmitted."""
+        return {
+            "packed_requests": self.requests,
+            "texts_per_request": self.packed_items / self.requests if self.requests else None,
+            "resubmitted": self.resubmitted,
+            "truncated_replies": self.truncated,
+            "pack_size": self.size,
+        }
+
+class Pipeline:
+    """Runs CryptoAnalyzer.analyze() over a stream of records concurrently.
+
+    Results are written in input order, or as soon as they are ready with
+    ordered=False. A record whose analysis fails gets an "error" field
+    instead of stopping the stream. With packed > 0, LLM texts are packed up
+    to that many per request by PackedLLM, within max_tokens.
+    """
+
+    def __init__(self, analyzer, text_field="text", ner_workers=4, llm_concurrency=16,
+                 max_pending=256, ordered=True, retries=5, packed=0, max_tokens=8000):
+        self.analyzer = analyzer
+        self.text_field = text_field
+        self.ner_workers = ner_workers
+        self.llm_concurrency = llm_concurrency
+        self.max_pending = max_pending
+        self.ordered = ordered
+        self.retries = retries
+        self.packed = packed
+        self.max_tokens = max_tokens
+        self.latencies = []
+        self.errors = 0
+
+    async def _analyze(self, record):
+        try:
+            text = record[self.text_field]
+            entities = await asyncio.get_running_loop().run_in_executor(self._ner_pool, self.analyzer.ner, text)
+            result = self.analyzer.cascade(text, entities)
+            if result is None and self._packer is not None:
+                response = await self._packer.submit(text)
+            elif result is None:
+                async with self._llm_slots:
+                    response = await call_with_retry(self.analyzer.llm_async, text, retries=self.retries)
+            if result is None:
+                self.analyzer.learn(response)
+                result = {"entities": entities, "llm": response, "skipped": False}
+        except Exception as e:
+            self.errors += 1
+            result = {"error": f"{type(e).__name__}: {e}"}
+        if "id" in record:
+            result = {"id": record["id"], **result}
+        return json.dumps(result, ensure_ascii=False) + "\n"
+
+    async def run(self, records, output_fp):
+        """Analyze every record and write the results to output_fp; return the run's stats."""
+        loop = asyncio.get_running_loop()
+        records = iter(records)
+        self._ner_pool = ThreadPoolExecutor(self.ner_workers)
+        self._llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        self._packer = None
+        if self.packed:
+            self._packer = PackedLLM(self.analyzer, self._llm_slots, self.packed, self.max_tokens, retries=self.retries)
+        in_flight = asyncio.Semaphore(self.max_pending)
+        done = {}  # seq -> result line, waiting for the records before it
+        next_seq = 0
+        tasks = set()
+
+        async def process(seq, record, received):
+            nonlocal next_seq
+            line = await self._analyze(record)
+            self.latencies.append(time.perf_counter() - received)
+            if not self.ordered:
+                output_fp.write(line)
+                in_flight.release()
+                return
+            done[seq] = line
+            while next_seq in done:
+                output_fp.write(done.pop(next_seq))
+                next_seq += 1
+                in_flight.release()
+
+        start = time.perf_counter()
+        seq = 0
+        try:
+            while True:
+                await in_flight.acquire()
+                # reading stdin blocks, so it happens off the event loop
+                record = await loop.run_in_executor(None, next, records, None)
+                if record is None:
+                    break
+                task = asyncio.create_task(process(seq, record, time.perf_counter()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                seq += 1
+            await asyncio.gather(*tasks)
+        finally:
+            self._ner_pool.shutdown()
+            if self._packer is not None:
+                await self._packer.close()
+        output_fp.flush()
+        seconds = time.perf_counter() - start
+        return {
+            "records": seq,
+            "errors": self.errors,
+            "seconds": seconds,
+            "records_per_second": seq / seconds if seconds else None,
+            "latency_p50_ms": _percentile(self.latencies, 0.50) * 1000 if self.latencies else None,
+            "latency_p95_ms": _percentile(self.latencies, 0.95) * 1000 if self.latencies else None,
+            **self.analyzer.cascade_stats(),
+            **(self._packer.stats() if self._packer is not None else {}),
+            **(self.analyzer.cache.stats() if self.analyzer.cache is not None else {}),
+        }
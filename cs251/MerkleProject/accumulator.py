@@ -0,0 +1,163 @@
+#!python3
+
+import sys
+import dbm
+from collections.abc import MutableMapping
+
+from prover import hash_leaf, hash_internal_node
+
+
+_empty_hashes = [b"\x00"]  # the prover pads the leaf level with b"\x00"
+
+
+def empty_hash(level):
+    """hash of a subtree of the given height that holds only padding."""
+    while len(_empty_hashes) <= level:
+        _empty_hashes.append(hash_internal_node(_empty_hashes[-1], _empty_hashes[-1]))
+    return _empty_hashes[level]
+
+
+def _dbm_key(key):
+    """encodes an int or a tuple of ints, e.g. (level, index), as a dbm key."""
+    if isinstance(key, int):
+        key = (key,)
+    return ":".join("{:x}".format(part) for part in key).encode()
+
+
+def _parse_dbm_key(key):
+    parts = tuple(int(part, 16) for part in key.decode().split(":"))
+    return parts[0] if len(parts) == 1 else parts
+
+
+class DbmStore(MutableMapping):
+    """An on-disk mapping from ints or tuples of ints to bytes, kept in a dbm
+       file, for node stores and values that do not fit in memory.
+       dbm (and so shelve) only takes str and bytes keys, so keys such as
+       (level, index) are encoded as hex numbers joined by colons."""
+
+    def __init__(self, filename, flag="c"):
+        self.db = dbm.open(filename, flag)
+
+    def __getitem__(self, key):
+        return self.db[_dbm_key(key)]
+
+    def __setitem__(self, key, value):
+        self.db[_dbm_key(key)] = value
+
+    def __delitem__(self, key):
+        del self.db[_dbm_key(key)]
+
+    def __iter__(self):
+        return map(_parse_dbm_key, self.db.keys())
+
+    def __len__(self):
+        return len(self.db)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MerkleAccumulator:
+    """An append-only Merkle tree that keeps only its right frontier in memory,
+       one hash per level, so appends and roots cost O(log n) hashes and
+       memory does not grow with the number of leaves.
+       Roots are the same as MerkleTree(leaves).root() for the same leaves.
+
+       Paths and consistency proofs against earlier sizes need the hashes of
+       complete subtrees. If a store is given (any mapping, e.g. a dict or a
+       DbmStore on disk), every complete subtree hash is written to it under
+       (level, index) as it is appended."""
+
+    def __init__(self, store=None):
+        self.size = 0  # number of leaves appended so far
+        self.frontier = []  # frontier[level] is the complete subtree for bit `level` of size
+        self.store = store
+
+    def append(self, leaf):
+        """appends a leaf and returns its position."""
+        node = hash_leaf(leaf)
+        level, index = 0, self.size
+        if self.store is not None:
+            self.store[(level, index)] = node
+        while index % 2 == 1:  # the new node completes a pair with the frontier node
+            node = hash_internal_node(self.frontier[level], node)
+            level, index = level + 1, index >> 1
+            if self.store is not None:
+                self.store[(level, index)] = node
+        if level == len(self.frontier):
+            self.frontier.append(node)
+        else:
+            self.frontier[level] = node
+        self.size += 1
+        return self.size - 1
+
+    def root(self):
+        """returns the root hash of the tree, as padded by the prover."""
+        assert self.size > 0, "Tree is empty."
+        height = (self.size - 1).bit_length()
+        node = None  # hash of the right edge below the current level, None if it is all padding
+        for level in range(height):
+            if (self.size >> level) % 2 == 1:
+                node = hash_internal_node(self.frontier[level], node or empty_hash(level))
+            elif node is not None:
+                node = hash_internal_node(node, empty_hash(level))
+        return node if node is not None else self.frontier[height]
+
+    def _node(self, level, index, size):
+        """returns the hash of a node in the tree as it was with size leaves."""
+        if index << level >= size:
+            return empty_hash(level)
+        if (index + 1) << level <= size:
+            if size == self.size and index == (size >> level) - 1 and (size >> level) % 2 == 1:
+                return self.frontier[level]  # complete node still held in the frontier
+            return self.store[(level, index)]
+        # the node is on the right edge of the tree: only one child can be incomplete
+        return hash_internal_node(self._node(level - 1, 2 * index, size),
+                                  self._node(level - 1, 2 * index + 1, size))
+
+    def path(self, pos, size=None):
+        """returns the path of hashes, from bottom to top, for the leaf at pos
+           in the tree as it was with size leaves (by default, the current tree)."""
+        assert self.store is not None, "Accumulator has no node store."
+        size = self.size if size is None else size
+        assert 0 <= pos < size <= self.size, "Leaf position out of range."
+        height = (size - 1).bit_length()
+        return [self._node(level, (pos >> level) ^ 1, size) for level in range(height)]
+
+    def consistency_proof(self, old_size, size=None):
+        """returns the hashes that prove that the tree with old_size leaves is
+           a prefix of the tree with size leaves (by default, the current tree).
+           The first hash is the largest complete subtree ending at old_size;
+           each following one is the sibling of the node holding the last old
+           leaf, from bottom to top."""
+        assert self.store is not None, "Accumulator has no node store."
+        size = self.size if size is None else size
+        assert 0 < old_size <= size <= self.size, "Tree size out of range."
+        start = (old_size & -old_size).bit_length() - 1
+        index = (old_size - 1) >> start
+        proof = [self._node(start, index, size)]
+        for level in range(start, (size - 1).bit_length()):
+            proof.append(self._node(level, index ^ 1, size))
+            index >>= 1
+        return proof
+
+
+# Main program
+if __name__ == "__main__":
+    acc = MerkleAccumulator(store={})
+    for i in range(1000):
+        acc.append(b"data item " + str(i).encode())
+    old_size, old_root = acc.size, acc.root()
+    for i in range(1000, 1500):
+        acc.append(b"data item " + str(i).encode())
+
+    proof = acc.consistency_proof(old_size)
+    print('\nI appended {} leaves; the tree grew from {} to {} leaves.'.format(acc.size, old_size, acc.size))
+    print('The consistency proof from root {} has {} hashes.\n'.format(old_root.hex()[:16], len(proof)))
+    sys.exit(0)
@@ -0,0 +1,140 @@
+#!python3
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from prover import MAX_HEIGHT, MerkleTree, gen_merkle_proof, write_proof, write_proofs
+from verifier import compute_merkle_root_from_proof, read_proof, read_proofs, verify_merkle_proofs
+
+GEN_PROOF_SAMPLES = 5  # gen_merkle_proof rebuilds the tree, so it gets only a few samples
+
+
+def _leaves(n):
+    return (b"data item " + str(i).encode() for i in range(n))
+
+
+def _latency(samples):
+    """returns the p50 and p99 of a list of durations, in microseconds."""
+    samples = sorted(samples)
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+    return {"p50_us": pick(0.50), "p99_us": pick(0.99)}
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds else None
+
+
+def bench_height(height, samples):
+    """benchmarks a tree of 2 ** height leaves and returns a dict of results.
+       gen_merkle_proof only takes trees below MAX_HEIGHT, so above it its
+       latency is None."""
+    n = 2 ** height
+    positions = random.Random(height).sample(range(n), min(samples, n))
+    result = {"height": height, "leaves": n}
+
+    start = time.perf_counter()
+    tree = MerkleTree(list(_leaves(n)))
+    result["build_s"] = time.perf_counter() - start
+    root = tree.root()
+
+    latencies = []
+    for pos in positions:
+        start = time.perf_counter()
+        tree.proof(pos)
+        latencies.append(time.perf_counter() - start)
+    result["proof_latency"] = _latency(latencies)
+    proofs = tree.proofs(positions)
+
+    result["gen_merkle_proof_latency"] = None
+    if height < MAX_HEIGHT:
+        leaves = tree.leaves
+        latencies = []
+        for pos in positions[:GEN_PROOF_SAMPLES]:
+            start = time.perf_counter()
+            gen_merkle_proof(leaves, pos)
+            latencies.append(time.perf_counter() - start)
+        result["gen_merkle_proof_latency"] = _latency(latencies)
+        del leaves
+    del tree
+    result["hashes_per_s"] = _rate(2 * n - 1, result["build_s"])
+
+    start = time.perf_counter()
+    for proof in proofs:
+        assert compute_merkle_root_from_proof(proof) == root, "Verify failed"
+    result["verify_proofs_per_s"] = _rate(len(proofs), time.perf_counter() - start)
+    results, stats = verify_merkle_proofs(proofs, root, workers=1)
+    assert all(results), "Verify failed"
+    result["batch_verify_proofs_per_s"] = stats["proofs_per_second"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text_files = [os.path.join(tmp, "proof-{}.txt".format(i)) for i in range(len(proofs))]
+        start = time.perf_counter()
+        for filename, proof in zip(text_files, proofs):
+            write_proof(filename, proof)
+        write_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for filename in text_files:
+            read_proof(filename)
+        read_s = time.perf_counter() - start
+        size = sum(os.path.getsize(filename) for filename in text_files)
+        result["text_format"] = {"bytes": size,
+                                 "write_proofs_per_s": _rate(len(proofs), write_s),
+                                 "read_proofs_per_s": _rate(len(proofs), read_s),
+                                 "write_mb_per_s": _rate(size / 1e6, write_s),
+                                 "read_mb_per_s": _rate(size / 1e6, read_s)}
+
+        binary_file = os.path.join(tmp, "proofs.bin")
+        start = time.perf_counter()
+        write_proofs(binary_file, proofs)
+        write_s = time.perf_counter() - start
+        start = time.perf_counter()
+        read_proofs(binary_file).close()
+        read_s = time.perf_counter() - start
+        size = os.path.getsize(binary_file)
+        result["binary_format"] = {"bytes": size,
+                                   "write_proofs_per_s": _rate(len(proofs), write_s),
+                                   "read_proofs_per_s": _rate(len(proofs), read_s),
+                                   "write_mb_per_s": _rate(size / 1e6, write_s),
+                                   "read_mb_per_s": _rate(size / 1e6, read_s)}
+
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+# Main program
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Merkle prover and verifier.")
+    parser.add_argument("--min-height", type=int, default=10, help="height of the smallest tree")
+    parser.add_argument("--max-height", type=int, default=24, help="height of the largest tree")
+    parser.add_argument("--step", type=int, default=2, help="height increment between trees")
+    parser.add_argument("--samples", type=int, default=1000, help="proofs sampled per tree")
+    parser.add_argument("--output", help="file to write the JSON report to (default: stdout)")
+    args = parser.parse_args()
+
+    report = {"python": platform.python_version(), "platform": platform.platform(), "results": []}
+    spawn = multiprocessing.get_context("spawn")
+    for height in range(args.min_height, args.max_height + 1, args.step):
+        # a fresh process per tree, so peak RSS belongs to that tree alone
+        with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+            result = pool.submit(bench_height, height, args.samples).result()
+        report["results"].append(result)
+        print("height {:d}: built in {:.2f}s".format(height, result["build_s"]), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    sys.exit(0)
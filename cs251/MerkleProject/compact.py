@@ -0,0 +1,107 @@
+#!python3
+
+import sys
+
+from accumulator import empty_hash
+from prover import MerkleProof, hash_children, hash_leaf, hash_internal_node
+
+HASH_SIZE = 32
+
+
+class CompactMerkleTree:
+    """A MerkleTree whose levels are each one contiguous bytearray of 32-byte
+       slots instead of a list of bytes objects, which takes about a third of
+       the memory. Nodes that hold only padding are not stored; their hashes
+       come from empty_hash. Nodes and proof paths are memoryview slices of
+       the levels, so updating a leaf also changes paths already handed out.
+       Building is somewhat slower than MerkleTree, since every node is
+       sliced in and out of the buffers."""
+
+    def __init__(self, leaves):
+        assert leaves, "No leaves."
+        height = (len(leaves) - 1).bit_length()
+
+        self.leaves = list(leaves)  # a copy, since update() replaces leaves in place
+        self.height = height
+
+        # levels[0] holds the hashed leaves, levels[height] holds the root
+        state = bytearray(len(leaves) * HASH_SIZE)
+        for i, leaf in enumerate(leaves):
+            state[i * HASH_SIZE:(i + 1) * HASH_SIZE] = hash_leaf(leaf)
+        self.levels = [state]
+        self._views = [memoryview(state)]
+        for level in range(1, height + 1):
+            size = ((len(leaves) - 1) >> level) + 1
+            self.levels.append(bytearray(size * HASH_SIZE))
+            self._views.append(memoryview(self.levels[-1]))
+            self._hash_level(level)
+
+    def _hash_level(self, level):
+        """computes every node in level from the level below."""
+        below, state = self._views[level - 1], self._views[level]
+        pairs = len(below) // (2 * HASH_SIZE)
+        for i in range(pairs):
+            # the two children are adjacent slots, so they are hashed straight from the buffer
+            state[i * HASH_SIZE:(i + 1) * HASH_SIZE] = hash_children(below[2 * i * HASH_SIZE:(2 * i + 2) * HASH_SIZE])
+        if len(state) > pairs * HASH_SIZE:
+            self._rehash(level, pairs)  # the last node has only padding on its right
+
+    def _rehash(self, level, index):
+        """recomputes the node at index in level from its children."""
+        below = self._views[level - 1]
+        start = 2 * index * HASH_SIZE
+        if start + HASH_SIZE < len(below):
+            node = hash_children(below[start:start + 2 * HASH_SIZE])
+        else:
+            node = hash_internal_node(below[start:start + HASH_SIZE], empty_hash(level - 1))
+        self._views[level][index * HASH_SIZE:(index + 1) * HASH_SIZE] = node
+
+    def node(self, level, index):
+        """returns the hash of the node at index in level."""
+        start = index * HASH_SIZE
+        if start >= len(self.levels[level]):
+            return empty_hash(level)
+        return self._views[level][start:start + HASH_SIZE]
+
+    def root(self):
+        """returns the root hash of the tree."""
+        return self.node(self.height, 0)
+
+    def proof(self, pos):
+        """returns the MerkleProof for the leaf at pos."""
+        assert 0 <= pos < len(self.leaves), "Leaf position out of range."
+        path = [self.node(level, (pos >> level) ^ 1) for level in range(self.height)]
+        return MerkleProof(self.leaves[pos], pos, path)
+
+    def proofs(self, positions):
+        """returns the MerkleProofs for the leaves at the given positions."""
+        return [self.proof(pos) for pos in positions]
+
+    def update(self, pos, leaf):
+        """replaces the leaf at pos and rehashes its path to the root."""
+        self.update_many({pos: leaf})
+
+    def update_many(self, updates):
+        """replaces the leaves given as a {pos: leaf} dict and rehashes their
+           paths to the root, each shared ancestor once."""
+        dirty = set()  # positions of the nodes to rehash on the current level
+        for pos, leaf in updates.items():
+            assert 0 <= pos < len(self.leaves), "Leaf position out of range."
+            self.leaves[pos] = leaf
+            self._views[0][pos * HASH_SIZE:(pos + 1) * HASH_SIZE] = hash_leaf(leaf)
+            dirty.add(pos >> 1)
+        for level in range(1, self.height + 1):
+            for i in dirty:
+                self._rehash(level, i)
+            dirty = {i >> 1 for i in dirty}
+
+
+# Main program
+if __name__ == "__main__":
+    leaves = [b"data item " + str(i).encode() for i in range(1000)]
+    tree = CompactMerkleTree(leaves)
+    nodes = sum(len(level) for level in tree.levels) // HASH_SIZE
+    print('\nI built a compact Merkle tree of {} leaves in {} bytes of levels ({} nodes).'.format(
+        len(leaves), nodes * HASH_SIZE, nodes))
+    print('Its root is {}.\n'.format(bytes(tree.root()).hex()))
+    sys.exit(0)
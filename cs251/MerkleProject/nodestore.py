@@ -0,0 +1,123 @@
+#!python3
+
+import mmap
+import struct
+import sys
+
+from accumulator import empty_hash
+from prover import MerkleProof, MerkleTree
+
+# File layout, all integers little-endian:
+#   header       magic, version, tree height, number of leaves
+#   levels       for level 0 (hashed leaves) up to the root, the hashes of the
+#                nodes that hold at least one leaf, as contiguous 32-byte records;
+#                nodes that hold only padding are not stored
+#   leaf offsets number of leaves + 1 offsets into the leaf data
+#   leaf data    the leaves, concatenated
+MAGIC = b"MRKN"
+VERSION = 1
+HEADER = struct.Struct("<4sBxxxQQ")
+HASH_SIZE = 32
+OFFSET = struct.Struct("<Q")
+
+
+def _level_size(num_leaves, level):
+    """number of nodes at level that hold at least one leaf."""
+    return ((num_leaves - 1) >> level) + 1
+
+
+def write_node_store(filename, tree: MerkleTree):
+    """writes the levels and leaves of a MerkleTree or CompactMerkleTree to filename."""
+    assert getattr(tree, "padded", True), "Node stores hold padded trees only."
+    num_leaves = len(tree.leaves)
+    with open(filename, "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, tree.height, num_leaves))
+        for level, nodes in enumerate(tree.levels):
+            if isinstance(nodes, bytearray):
+                fp.write(nodes)  # a CompactMerkleTree level is already in this layout
+            else:
+                fp.write(b"".join(nodes[:_level_size(num_leaves, level)]))
+        offset = 0
+        fp.write(OFFSET.pack(offset))
+        for leaf in tree.leaves:
+            offset += len(leaf)
+            fp.write(OFFSET.pack(offset))
+        for leaf in tree.leaves:
+            fp.write(leaf)
+
+
+class MerkleNodeStore:
+    """A Merkle tree written by write_node_store, memory-mapped read-only.
+       Opening reads only the header, and nodes are memoryview slices of the
+       mapping, so many processes can serve proofs from one file without
+       rebuilding the tree or holding it in memory.
+       Paths returned by proof() keep the mapping alive: if some are still
+       referenced when the store is closed, the file is unmapped once the
+       last of them is released."""
+
+    def __init__(self, filename):
+        with open(filename, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, self.height, self.num_leaves = HEADER.unpack_from(self._view)
+        assert magic == MAGIC, "Not a Merkle node store."
+        assert version == VERSION, "Unsupported node store version."
+
+        # offset in the file of the first node of each level
+        self._levels = []
+        offset = HEADER.size
+        for level in range(self.height + 1):
+            self._levels.append(offset)
+            offset += _level_size(self.num_leaves, level) * HASH_SIZE
+        self._leaf_offsets = offset
+        self._leaf_data = offset + (self.num_leaves + 1) * OFFSET.size
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # nodes handed out still point into the mapping; it is unmapped with the last of them
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def node(self, level, index):
+        """returns the hash of the node at index in level."""
+        if index >= _level_size(self.num_leaves, level):
+            return empty_hash(level)
+        start = self._levels[level] + index * HASH_SIZE
+        return self._view[start:start + HASH_SIZE]
+
+    def leaf(self, pos):
+        """returns the data of the leaf at pos."""
+        start, = OFFSET.unpack_from(self._view, self._leaf_offsets + pos * OFFSET.size)
+        end, = OFFSET.unpack_from(self._view, self._leaf_offsets + (pos + 1) * OFFSET.size)
+        return self._view[self._leaf_data + start:self._leaf_data + end]
+
+    def root(self):
+        """returns the root hash of the tree."""
+        return self.node(self.height, 0)
+
+    def proof(self, pos):
+        """returns the MerkleProof for the leaf at pos."""
+        assert 0 <= pos < self.num_leaves, "Leaf position out of range."
+        path = [self.node(level, (pos >> level) ^ 1) for level in range(self.height)]
+        return MerkleProof(bytes(self.leaf(pos)), pos, path)
+
+
+# Main program
+if __name__ == "__main__":
+    storefile = "tree.bin"
+    leaves = [b"data item " + str(i).encode() for i in range(1000)]
+    write_node_store(storefile, MerkleTree(leaves))
+    print('\nI wrote a Merkle tree of {} leaves to {}.'.format(len(leaves), storefile))
+
+    with MerkleNodeStore(storefile) as store:
+        proof = store.proof(743)
+        print('I read a Merkle proof of {} hashes for leaf #{} from it.\n'.format(len(proof.path), proof.pos))
+    sys.exit(0)
@@ -4,35 +4,84 @@ import sys
 import hashlib
 from base64 import b64encode, b64decode
 import math
+import struct
+from concurrent.futures import ProcessPoolExecutor
 
 prooffile = "proof.txt"  # File where Merkle proof will be written.
 
 MAX_HEIGHT = 20  # Max height of Merkle tree
 
+# Binary proof file layout, all integers little-endian:
+#   header   magic, version
+#   records  for each proof: position, tree size (0 if padded), leaf length,
+#            path length, leaf data, path hashes (32 bytes each; the b"\x00"
+#            padding placeholder is stored as 32 zero bytes)
+#   index    offset in the file of each record
+#   footer   number of proofs, offset of the index
+# Version 1 records have no tree size.
+PROOF_MAGIC = b"MRKP"
+PROOF_VERSION = 2
+PROOF_HEADER = struct.Struct("<4sB")
+PROOF_RECORD = struct.Struct("<QQIH")
+PROOF_FOOTER = struct.Struct("<QQ")
+HASH_SIZE = 32
+PADDING_RECORD = bytes(HASH_SIZE)
+
 
 class MerkleProof:
-    def __init__(self, leaf, pos, path):
+    def __init__(self, leaf, pos, path, size=None):
         self.leaf = leaf  # data of leaf being checked
         self.pos = pos  # the position in the tree of the leaf being checked
         self.path = path  # the path of hashes, from bottom to the top of tree
+        self.size = size  # the number of leaves of an unpadded tree, None if the tree is padded
+
+
+class MerkleMultiProof:
+    def __init__(self, leaves, positions, hashes, height):
+        self.leaves = leaves  # data of the leaves being checked, in order of position
+        self.positions = positions  # the sorted positions in the tree of the leaves being checked
+        self.hashes = hashes  # the sibling hashes not computable from the leaves, bottom-up and left to right
+        self.height = height  # the height of the tree
+
+
+# sha256 states that have already absorbed the hash prefixes; copying one
+# is cheaper than creating a new sha256 object for every hash
+_leaf_sha256 = hashlib.sha256(b"leaf:")  # hash prefix for a leaf
+_node_sha256 = hashlib.sha256(b"node:")  # hash prefix for an internal node
+_size_sha256 = hashlib.sha256(b"size:")  # hash prefix for the root of an unpadded tree
 
 
 def hash_leaf(leaf):
     """hash a leaf value."""
-    sha256 = hashlib.sha256()
-    sha256.update(b"leaf:")  # hash prefix for a leaf
+    sha256 = _leaf_sha256.copy()
     sha256.update(leaf)
     return sha256.digest()
 
 
 def hash_internal_node(left, right):
     """hash an internal node."""
-    sha256 = hashlib.sha256()
-    sha256.update(b"node:")  # hash prefix for an internal node
+    sha256 = _node_sha256.copy()
     sha256.update(left)
     sha256.update(right)
     return sha256.digest()
 
+
+def hash_children(children):
+    """hash an internal node from a buffer holding its left and right
+       children back to back; the same as hash_internal_node(left, right)."""
+    sha256 = _node_sha256.copy()
+    sha256.update(children)
+    return sha256.digest()
+
+
+def hash_unpadded_root(size, top):
+    """hash the number of leaves of an unpadded tree into its root, so that
+       a proof cannot claim a different size than the tree it came from."""
+    sha256 = _size_sha256.copy()
+    sha256.update(size.to_bytes(8, "little"))
+    sha256.update(top)
+    return sha256.digest()
+
 #  The prefixes in the two functions above are a security measure.
 #  They provide domain separation, meaning that the domain of a leaf hash
 #  is seperated from the domain of an internal node hash.
@@ -60,7 +109,7 @@ def gen_merkle_proof(leaves, pos):
     level_pos = pos  # local copy of pos
 
     for level in range(height):
-        sibling = state[level_pos+1] if level_pos % 2 == 0 else sibling = state[level_pos-1]
+        sibling = state[level_pos+1] if level_pos % 2 == 0 else state[level_pos-1]
         path.append(sibling)
         state = [hash_internal_node(state[2 * i], state[2 * i + 1]) for i in range(len(state) // 2)]
         level_pos = level_pos // 2
@@ -69,17 +118,192 @@ def gen_merkle_proof(leaves, pos):
     return path
 
 
+def gen_merkle_multiproof(leaves, positions):
+    """Takes as input a list of leaves and a list of leaf positions.
+       Returns one Merkle multiproof for all the leaves at those positions."""
+    return MerkleTree(leaves).multiproof(positions)
+
+
+def _hash_levels(leaves, size):
+    """hashes the leaves, pads them to size (a power of two) as gen_merkle_proof
+       does, and returns every level of the resulting (sub)tree."""
+    state = list(map(hash_leaf, leaves))
+    state += [b"\x00"] * (size - len(leaves))
+    levels = [state]
+    while len(state) > 1:
+        state = [hash_internal_node(state[2 * i], state[2 * i + 1]) for i in range(len(state) // 2)]
+        levels.append(state)
+    return levels
+
+
+def _hash_levels_unpadded(leaves):
+    """hashes the leaves and returns every level of the unpadded tree over them,
+       in which the last node of a level with an odd number of nodes has no
+       sibling and is promoted to the next level unchanged."""
+    state = list(map(hash_leaf, leaves))
+    levels = [state]
+    while len(state) > 1:
+        parents = [hash_internal_node(state[2 * i], state[2 * i + 1]) for i in range(len(state) // 2)]
+        if len(state) % 2 == 1:
+            parents.append(state[-1])  # promote the lone node
+        state = parents
+        levels.append(state)
+    return levels
+
+
+class MerkleTree:
+    """A Merkle tree that hashes its leaves once and keeps every level,
+       so that each proof is a lookup of one sibling per level.
+
+       With workers > 1 the leaves are split into aligned subtrees that are
+       hashed in a pool of worker processes (sha256 holds the GIL for inputs
+       as small as a leaf or a node, so threads would not help), and the
+       levels above the subtrees are hashed here. The result is the same as
+       a serial build.
+
+       With padded=False no padding is added: a node without a sibling is
+       promoted as it is, which skips the hashing of padding subtrees and
+       leaves their placeholders out of proofs. Proofs then carry the number
+       of leaves, which tells the verifier which levels have no sibling, and
+       the root is hash_unpadded_root of that number and the top node.
+       Unpadded trees are always built serially."""
+
+    def __init__(self, leaves, workers=1, padded=True):
+        assert leaves, "No leaves."
+        height = (len(leaves) - 1).bit_length()
+
+        self.leaves = list(leaves)  # a copy, since update() replaces leaves in place
+        self.height = height
+        self.padded = padded
+
+        # levels[0] holds the hashed leaves, levels[height] holds the root
+        if not padded:
+            self.levels = _hash_levels_unpadded(leaves)
+        elif workers > 1 and height > 0:
+            self.levels = self._hash_levels_parallel(workers)
+        else:
+            self.levels = _hash_levels(leaves, 2 ** height)
+
+    def _hash_levels_parallel(self, workers):
+        # about four subtrees per worker, so that uneven workers even out
+        chunk_height = max(0, self.height - (4 * workers - 1).bit_length())
+        chunk = 2 ** chunk_height
+        chunks = [self.leaves[i:i + chunk] for i in range(0, len(self.leaves), chunk)]
+        with ProcessPoolExecutor(workers) as pool:
+            subtrees = list(pool.map(_hash_levels, chunks, [chunk] * len(chunks)))
+
+        # subtrees that hold only padding are all the same
+        padding = _hash_levels([], chunk)
+        subtrees += [padding] * (2 ** (self.height - chunk_height) - len(subtrees))
+
+        levels = [[node for subtree in subtrees for node in subtree[level]] for level in range(chunk_height + 1)]
+        state = levels[-1]
+        while len(state) > 1:
+            state = [hash_internal_node(state[2 * i], state[2 * i + 1]) for i in range(len(state) // 2)]
+            levels.append(state)
+        return levels
+
+    def root(self):
+        """returns the root hash of the tree."""
+        if not self.padded:
+            return hash_unpadded_root(len(self.leaves), self.levels[-1][0])
+        return self.levels[-1][0]
+
+    def update(self, pos, leaf):
+        """replaces the leaf at pos and rehashes its path to the root."""
+        self.update_many({pos: leaf})
+
+    def update_many(self, updates):
+        """replaces the leaves given as a {pos: leaf} dict and rehashes their
+           paths to the root, each shared ancestor once, so k updates cost
+           O(k log n) hashes."""
+        dirty = set()  # positions of the nodes to rehash on the current level
+        for pos, leaf in updates.items():
+            assert 0 <= pos < len(self.leaves), "Leaf position out of range."
+            self.leaves[pos] = leaf
+            self.levels[0][pos] = hash_leaf(leaf)
+            dirty.add(pos >> 1)
+        for level in range(1, self.height + 1):
+            below, state = self.levels[level - 1], self.levels[level]
+            for i in dirty:
+                if 2 * i + 1 < len(below):
+                    state[i] = hash_internal_node(below[2 * i], below[2 * i + 1])
+                else:
+                    state[i] = below[2 * i]  # a promoted node of an unpadded tree
+            dirty = {i >> 1 for i in dirty}
+
+    def proof(self, pos):
+        """returns the MerkleProof for the leaf at pos."""
+        assert 0 <= pos < len(self.leaves), "Leaf position out of range."
+        path = []
+        level_pos = pos
+        for level in range(self.height):
+            if level_pos ^ 1 < len(self.levels[level]):  # no sibling if the node was promoted
+                path.append(self.levels[level][level_pos ^ 1])  # sibling of the node at level_pos
+            level_pos >>= 1
+        size = None if self.padded else len(self.leaves)
+        return MerkleProof(self.leaves[pos], pos, path, size)
+
+    def proofs(self, positions):
+        """returns the MerkleProofs for the leaves at the given positions."""
+        return [self.proof(pos) for pos in positions]
+
+    def multiproof(self, positions):
+        """returns a MerkleMultiProof for the leaves at the given positions.
+           A sibling hash is included only when the verifier cannot compute it
+           from the proven leaves, so shared upper levels are sent once."""
+        assert self.padded, "Multiproofs need a padded tree."
+        known = sorted(set(positions))
+        assert known, "No leaf positions given."
+        assert 0 <= known[0] and known[-1] < len(self.leaves), "Leaf position out of range."
+        leaves = [self.leaves[pos] for pos in known]
+        positions = list(known)
+
+        hashes = []
+        for level in range(self.height):
+            parents = []
+            i = 0
+            while i < len(known):
+                level_pos = known[i]
+                if i + 1 < len(known) and known[i + 1] == level_pos ^ 1:
+                    i += 2  # both children are known, the sibling is not needed
+                else:
+                    hashes.append(self.levels[level][level_pos ^ 1])
+                    i += 1
+                parents.append(level_pos >> 1)
+            known = parents
+        return MerkleMultiProof(leaves, positions, hashes, self.height)
+
+
 # Helper function
 def write_proof(filename, proof: MerkleProof):
     fp = open(filename, "w")
     print("leaf position: {pos:d}".format(pos=proof.pos), file=fp)
     print("leaf value: \"{leaf:s}\"".format(leaf=proof.leaf.decode('utf-8')), file=fp)
+    if proof.size is not None:
+        print("unpadded tree size: {size:d}".format(size=proof.size), file=fp)
     print("Hash values in proof:", file=fp)
     for i in range(len(proof.path)):
         print("  {:s}".format(b64encode(proof.path[i]).decode('utf-8')), file=fp)
     fp.close()
 
 
+def write_proofs(filename, proofs):
+    """writes many proofs to a binary proof file, one at a time, so proofs
+       can be streamed from a generator. write_proof remains the text export."""
+    with open(filename, "wb") as fp:
+        fp.write(PROOF_HEADER.pack(PROOF_MAGIC, PROOF_VERSION))
+        index = []
+        for proof in proofs:
+            index.append(fp.tell())
+            fp.write(PROOF_RECORD.pack(proof.pos, proof.size or 0, len(proof.leaf), len(proof.path)))
+            fp.write(proof.leaf)
+            fp.write(b"".join(node if len(node) == HASH_SIZE else PADDING_RECORD for node in proof.path))
+        index_offset = fp.tell()
+        fp.write(struct.pack("<{:d}Q".format(len(index)), *index))
+        fp.write(PROOF_FOOTER.pack(len(index), index_offset))
+
+
 # Main program
 if __name__ == "__main__":
     # Generate 1000 leaves
@@ -88,8 +312,8 @@ if __name__ == "__main__":
 
     # Generate proof for leaf #743
     pos = 743
-    path = gen_merkle_proof(leaves, pos)
-    proof = MerkleProof(leaves[pos], pos, path)
+    tree = MerkleTree(leaves)
+    proof = tree.proof(pos)
 
     # write proof to file
     write_proof(prooffile, proof)
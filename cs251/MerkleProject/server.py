@@ -0,0 +1,184 @@
+#!python3
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from base64 import b64decode, b64encode
+from collections import OrderedDict, deque
+
+from nodestore import MerkleNodeStore
+from prover import MerkleTree
+
+# Line protocol: one request per line, one JSON object per response line.
+#   ROOTS                          the roots being served
+#   PROOF <root> <pos>             the proof for the leaf at pos
+#   MULTIPROOF <root> <pos> ...    one multiproof for the leaves at the positions
+#   STATS                          cache and latency statistics
+# Roots and hashes are base64, as in the proof text format.
+LATENCY_WINDOW = 10000  # number of recent requests latency percentiles are taken over
+
+
+def _b64(data):
+    return b64encode(data).decode("utf-8")
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+
+
+class ProofServer:
+    """Serves proofs for any number of trees, keyed by their roots.
+       Trees can be MerkleTree, CompactMerkleTree or MerkleNodeStore objects;
+       multiproofs need a MerkleTree. Encoded responses for recently
+       requested proofs are kept in an LRU cache of cache_size entries."""
+
+    def __init__(self, trees, cache_size=4096):
+        self.trees = {bytes(tree.root()): tree for tree in trees}
+        self.cache = OrderedDict()  # (root, pos) -> encoded response line
+        self.cache_size = cache_size
+        self.hits = self.misses = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def _tree(self, root):
+        tree = self.trees.get(b64decode(root))
+        if tree is None:
+            raise ValueError("unknown root")
+        return tree
+
+    def _proof(self, root, pos):
+        key = (root, pos)
+        response = self.cache.get(key)
+        if response is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return response
+        proof = self._tree(root).proof(pos)
+        self.misses += 1  # only requests that produce a proof count
+        response = self._encode({"pos": proof.pos, "leaf": _b64(proof.leaf), "size": proof.size,
+                                 "path": [_b64(node) for node in proof.path]})
+        self.cache[key] = response
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return response
+
+    def _multiproof(self, root, positions):
+        tree = self._tree(root)
+        if not hasattr(tree, "multiproof"):
+            raise ValueError("multiproofs are not served for this tree")
+        proof = tree.multiproof(positions)
+        return self._encode({"positions": proof.positions, "height": proof.height,
+                             "leaves": [_b64(leaf) for leaf in proof.leaves],
+                             "hashes": [_b64(node) for node in proof.hashes]})
+
+    def stats(self):
+        """returns cache and latency statistics for the requests served so far."""
+        return {"roots": len(self.trees), "cache_entries": len(self.cache),
+                "cache_hits": self.hits, "cache_misses": self.misses,
+                "latency_p50_us": _percentile(self.latencies, 0.50),
+                "latency_p99_us": _percentile(self.latencies, 0.99)}
+
+    @staticmethod
+    def _encode(response):
+        return (json.dumps(response) + "\n").encode("utf-8")
+
+    def handle_request(self, line):
+        """returns the encoded response to one request line."""
+        start = time.perf_counter()
+        try:
+            words = line.decode("utf-8").split()
+            if words == ["ROOTS"]:
+                response = self._encode({"roots": [_b64(root) for root in self.trees]})
+            elif words == ["STATS"]:
+                response = self._encode(self.stats())
+            elif len(words) == 3 and words[0] == "PROOF":
+                response = self._proof(words[1], int(words[2]))
+            elif len(words) > 2 and words[0] == "MULTIPROOF":
+                response = self._multiproof(words[1], [int(word) for word in words[2:]])
+            else:
+                raise ValueError("bad request")
+        except (ValueError, AssertionError, IndexError) as e:
+            response = self._encode({"error": str(e) or type(e).__name__})
+        self.latencies.append((time.perf_counter() - start) * 1e6)
+        return response
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                writer.write(self.handle_request(line))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+async def run_client(host, port, requests, connections):
+    """sends the request lines over the given number of connections, each
+       waiting for one response before sending the next request.
+       Returns the throughput and latency seen by the client."""
+    pending = deque(requests)
+    latencies = []
+
+    async def worker():
+        reader, writer = await asyncio.open_connection(host, port)
+        while pending:
+            request = pending.popleft()
+            start = time.perf_counter()
+            writer.write(request.encode("utf-8") + b"\n")
+            await writer.drain()
+            await reader.readline()
+            latencies.append((time.perf_counter() - start) * 1e6)
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    seconds = time.perf_counter() - start
+    return {"requests": len(latencies), "seconds": seconds,
+            "requests_per_second": len(latencies) / seconds if seconds else None,
+            "latency_p50_us": _percentile(latencies, 0.50),
+            "latency_p99_us": _percentile(latencies, 0.99)}
+
+
+# Main program
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Merkle proofs over a line protocol.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="serve proofs")
+    serve.add_argument("stores", nargs="*", help="node store files to serve (default: a demo tree of 1000 leaves)")
+    serve.add_argument("--cache-size", type=int, default=4096, help="number of proofs kept in the LRU cache")
+    bench = commands.add_parser("bench", help="measure the throughput of a running server")
+    bench.add_argument("--requests", type=int, default=10000, help="number of proof requests")
+    bench.add_argument("--connections", type=int, default=8, help="number of concurrent connections")
+    bench.add_argument("--hot", type=int, default=100, help="number of distinct leaves requested")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if args.stores:
+            trees = [MerkleNodeStore(filename) for filename in args.stores]
+        else:
+            trees = [MerkleTree([b"data item " + str(i).encode() for i in range(1000)])]
+        proof_server = ProofServer(trees, args.cache_size)
+        for root in proof_server.trees:
+            print('Serving root {} on {}:{}'.format(_b64(root), args.host, args.port))
+        asyncio.run(proof_server.serve(args.host, args.port))
+    else:
+        async def bench_server():
+            reader, writer = await asyncio.open_connection(args.host, args.port)
+            writer.write(b"ROOTS\n")
+            roots = json.loads(await reader.readline())["roots"]
+            writer.close()
+            requests = ["PROOF {} {}".format(random.choice(roots), random.randrange(args.hot))
+                        for _ in range(args.requests)]
+            return await run_client(args.host, args.port, requests, args.connections)
+        print(json.dumps(asyncio.run(bench_server()), indent=2))
+    sys.exit(0)
@@ -0,0 +1,131 @@
+#!python3
+
+import sys
+from collections import deque
+
+from accumulator import empty_hash
+from prover import hash_leaf, hash_internal_node
+
+DEPTH = 256  # keys are 256-bit integers, one leaf per key
+
+empty_hash(DEPTH)  # precompute the default hash of every level
+
+
+def _key_index(key):
+    """returns the leaf position of a key given as an int or as 32 bytes."""
+    if isinstance(key, bytes):
+        assert len(key) == DEPTH // 8, "Keys must be 32 bytes."
+        key = int.from_bytes(key, "big")
+    assert 0 <= key < 2 ** DEPTH, "Key out of range."
+    return key
+
+
+class SparseMerkleProof:
+    def __init__(self, key, value, bitmap, siblings):
+        self.key = key  # the key being checked, as an int
+        self.value = value  # the value stored under key, or None if the key is absent
+        self.bitmap = bitmap  # bit `level` is set if the sibling at that level is not a default hash
+        self.siblings = siblings  # the siblings that are not default hashes, from bottom to top
+
+
+class SparseMerkleTree:
+    """A Merkle tree with one leaf for every 256-bit key, almost all of them empty.
+       An empty leaf is the same b"\\x00" placeholder the prover pads with, so
+       every subtree without keys has the default hash empty_hash(level) and
+       only nodes that differ from it are kept in the store (any mapping from
+       (level, index) to hash, e.g. a dict or an accumulator.DbmStore on disk).
+       The values are kept in another mapping, from key to value, which can be
+       a DbmStore too. Updates and proofs cost DEPTH hashes and lookups."""
+
+    def __init__(self, store=None, values=None):
+        self.store = {} if store is None else store  # (level, index) -> non-default node hash
+        self.values = {} if values is None else values  # key -> value
+
+    def _node(self, level, index):
+        return self.store.get((level, index), empty_hash(level))
+
+    def _set_node(self, level, index, node):
+        if node == empty_hash(level):
+            self.store.pop((level, index), None)
+        else:
+            self.store[(level, index)] = node
+
+    def root(self):
+        """returns the root hash of the tree."""
+        return self._node(DEPTH, 0)
+
+    def get(self, key):
+        """returns the value stored under key, or None."""
+        return self.values.get(_key_index(key))
+
+    def update(self, key, value):
+        """stores value under key, or removes key if value is None,
+           and rehashes the path from its leaf to the root."""
+        index = _key_index(key)
+        if value is None:
+            self.values.pop(index, None)
+            node = empty_hash(0)
+        else:
+            self.values[index] = value
+            node = hash_leaf(value)
+        for level in range(DEPTH):
+            self._set_node(level, index, node)
+            sibling = self._node(level, index ^ 1)
+            if index % 2 == 0:
+                node = hash_internal_node(node, sibling)
+            else:
+                node = hash_internal_node(sibling, node)
+            index >>= 1
+        self._set_node(DEPTH, 0, node)
+
+    def proof(self, key):
+        """returns a SparseMerkleProof that key holds its value, or that it
+           is absent. Default siblings are left out and marked in a bitmap."""
+        index = _key_index(key)
+        bitmap = 0
+        siblings = []
+        for level in range(DEPTH):
+            sibling = self.store.get((level, (index >> level) ^ 1))
+            if sibling is not None:
+                bitmap |= 1 << level
+                siblings.append(sibling)
+        return SparseMerkleProof(index, self.values.get(index), bitmap, siblings)
+
+
+def compute_root_from_sparse_proof(proof: SparseMerkleProof):
+    """computes a root from the given key, value and sparse Merkle proof."""
+    index = proof.key
+    siblings = deque(proof.siblings)
+    node = empty_hash(0) if proof.value is None else hash_leaf(proof.value)
+    for level in range(DEPTH):
+        if (proof.bitmap >> level) % 2 == 1:
+            assert siblings, "Proof is too short"
+            sibling = siblings.popleft()
+        else:
+            sibling = empty_hash(level)
+        if index % 2 == 0:
+            node = hash_internal_node(node, sibling)
+        else:
+            node = hash_internal_node(sibling, node)
+        index >>= 1
+    assert not siblings, "Proof is too long"
+    return node  # return the computed root
+
+
+# Main program
+if __name__ == "__main__":
+    tree = SparseMerkleTree()
+    for i in range(1000):
+        account = hash_leaf(b"account " + str(i).encode())
+        tree.update(account, str(i * 100).encode())
+    print('\nI stored 1000 account balances in a sparse Merkle tree.')
+
+    member = tree.proof(hash_leaf(b"account 743"))
+    assert compute_root_from_sparse_proof(member) == tree.root(), "Verify failed"
+    print('I verified that account 743 holds {} ({} of {} siblings sent).'.format(
+        member.value.decode("utf-8"), len(member.siblings), DEPTH))
+
+    absent = tree.proof(hash_leaf(b"account 1000"))
+    assert absent.value is None and compute_root_from_sparse_proof(absent) == tree.root(), "Verify failed"
+    print('I verified that account 1000 is absent ({} of {} siblings sent).\n'.format(len(absent.siblings), DEPTH))
+    sys.exit(0)
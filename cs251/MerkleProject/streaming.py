@@ -0,0 +1,89 @@
+#!python3
+
+import argparse
+import struct
+import sys
+from base64 import b64encode
+
+from accumulator import MerkleAccumulator
+from prover import MerkleProof, write_proof
+
+RECORD_HEADER = struct.Struct(">I")  # length prefix of each record in a binary record file
+
+
+class _PathNodes(dict):
+    """A node store that keeps only the siblings on the paths of chosen leaves,
+       so a streaming build holds O(k log n) hashes for k proofs."""
+
+    def __init__(self, positions):
+        super().__init__()
+        self.positions = set(positions)
+        self.prefixes = []  # prefixes[level] is the set of chosen positions >> level
+
+    def __setitem__(self, key, node):
+        level, index = key
+        while len(self.prefixes) <= level:
+            self.prefixes.append({pos >> len(self.prefixes) for pos in self.positions})
+        if index ^ 1 in self.prefixes[level]:
+            super().__setitem__(key, node)
+
+
+def read_lines(filename):
+    """yields the lines of a newline-delimited file as leaves, without the newline."""
+    with open(filename, "rb") as fp:
+        for line in fp:
+            yield line[:-1] if line.endswith(b"\n") else line
+
+
+def read_records(filename):
+    """yields the records of a binary file in which each record is prefixed
+       by its length as a 4-byte big-endian integer."""
+    with open(filename, "rb") as fp:
+        while True:
+            header = fp.read(RECORD_HEADER.size)
+            if not header:
+                return
+            assert len(header) == RECORD_HEADER.size, "Truncated record header."
+            (length,) = RECORD_HEADER.unpack(header)
+            record = fp.read(length)
+            assert len(record) == length, "Truncated record."
+            yield record
+
+
+def stream_merkle_root(leaves, positions=()):
+    """Takes as input an iterable of leaves and a list of leaf positions.
+       Reads the leaves in a single pass and returns the root of their Merkle
+       tree together with the Merkle proofs for the leaves at those positions.
+       Only the right frontier of the tree and the chosen proofs are kept in
+       memory, so the leaves can come from a file larger than RAM."""
+    nodes = _PathNodes(positions)
+    acc = MerkleAccumulator(store=nodes)
+    chosen = {}
+    for leaf in leaves:
+        pos = acc.append(leaf)
+        if pos in nodes.positions:
+            chosen[pos] = leaf
+    assert acc.size > 0, "No leaves."
+    assert len(chosen) == len(nodes.positions), "Leaf position out of range."
+    proofs = [MerkleProof(chosen[pos], pos, acc.path(pos)) for pos in positions]
+    return acc.root(), proofs
+
+
+# Main program
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the Merkle root of a file of leaves in one pass.")
+    parser.add_argument("filename", help="newline-delimited file of leaves")
+    parser.add_argument("--binary", action="store_true", help="read length-prefixed binary records instead of lines")
+    parser.add_argument("--proof", type=int, nargs="*", default=[], help="positions of leaves to write proofs for")
+    args = parser.parse_args()
+
+    leaves = read_records(args.filename) if args.binary else read_lines(args.filename)
+    root, proofs = stream_merkle_root(leaves, args.proof)
+
+    print('\nI computed the Merkle root: {}'.format(b64encode(root).decode('utf-8')))
+    for proof in proofs:
+        filename = "proof-for-leaf-{}.txt".format(proof.pos)
+        write_proof(filename, proof)
+        print('I generated a Merkle proof for leaf #{} in file {}'.format(proof.pos, filename))
+    print()
+    sys.exit(0)
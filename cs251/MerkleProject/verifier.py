@@ -4,19 +4,44 @@ import sys
 import hashlib
 from base64 import b64encode, b64decode
 from collections import deque
+import mmap
+import os
 import re
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
 
 prooffile = "proof.txt"  # File containing the Merkle proof to verify.
 # Change this to load a different file.
 
 MAX_HEIGHT = 20  # Max height of Merkle tree
 
+# Binary proof file layout, as written by prover.write_proofs
+PROOF_MAGIC = b"MRKP"
+PROOF_VERSION = 2
+PROOF_HEADER = struct.Struct("<4sB")
+PROOF_RECORDS = {1: struct.Struct("<QIH"), 2: struct.Struct("<QQIH")}  # version 1 has no tree size
+PROOF_FOOTER = struct.Struct("<QQ")
+PROOF_OFFSET = struct.Struct("<Q")
+HASH_SIZE = 32
+PADDING_RECORD = bytes(HASH_SIZE)  # how the b"\x00" padding placeholder is stored
+
 
 class MerkleProof:
-    def __init__(self, leaf, pos, path):
+    def __init__(self, leaf, pos, path, size=None):
         self.leaf = leaf  # data of leaf being checked
         self.pos = pos  # the position in the tree of the leaf being checked
         self.path = path  # the path of hashes, from bottom to the top of tree
+        self.size = size  # the number of leaves of an unpadded tree, None if the tree is padded
+
+
+class MerkleMultiProof:
+    def __init__(self, leaves, positions, hashes, height):
+        self.leaves = leaves  # data of the leaves being checked, in order of position
+        self.positions = positions  # the sorted positions in the tree of the leaves being checked
+        self.hashes = hashes  # the sibling hashes not computable from the leaves, bottom-up and left to right
+        self.height = height  # the height of the tree
 
 
 def hash_leaf(leaf):
@@ -36,6 +61,15 @@ def hash_internal_node(left, right):
     return sha256.digest()
 
 
+def hash_unpadded_root(size, top):
+    """hash the number of leaves of an unpadded tree into its root."""
+    sha256 = hashlib.sha256()
+    sha256.update(b"size:")  # hash prefix for the root of an unpadded tree
+    sha256.update(size.to_bytes(8, "little"))
+    sha256.update(top)
+    return sha256.digest()
+
+
 #  The prefixes in the two functions above are a security measure.
 #  They provide domain separation, meaning that the domain of a leaf hash
 #  is seperated from the domain of an internal node hash.
@@ -48,6 +82,8 @@ def compute_merkle_root_from_proof(proof: MerkleProof):
     pos = proof.pos
     path = deque(proof.path)
     root = hash_leaf(proof.leaf)
+    if getattr(proof, "size", None) is not None:
+        return _compute_unpadded_root(pos, path, root, proof.size)
     while path:
         if pos % 2 == 0:
             left, right = root, path.popleft()
@@ -58,18 +94,266 @@ def compute_merkle_root_from_proof(proof: MerkleProof):
     return root  # return the computed root
 
 
+def _compute_unpadded_root(pos, path, root, size):
+    """computes a root in a tree of size leaves that is not padded, where the
+       last node of a level with an odd number of nodes has no sibling and is
+       promoted to the next level unchanged.
+       The size comes from the proof, so it is hashed into the root: a proof
+       that claims another size than its tree's does not match its root."""
+    assert 0 <= pos < size, "Position out of range"
+    num_leaves = size
+    while size > 1:
+        if pos ^ 1 < size:
+            assert path, "Proof is too short"
+            if pos % 2 == 0:
+                left, right = root, path.popleft()
+            else:
+                left, right = path.popleft(), root
+            root = hash_internal_node(left, right)
+        pos >>= 1
+        size = (size + 1) // 2
+    assert not path, "Proof is too long"
+    return hash_unpadded_root(num_leaves, root)  # return the computed root
+
+
+def compute_merkle_root_from_multiproof(proof: MerkleMultiProof):
+    """computes a root from the given leaves and Merkle multiproof,
+       hashing each level once from the bottom to the top of the tree."""
+    assert len(proof.leaves) == len(proof.positions) > 0, "Malformed multiproof"
+    nodes = [(pos, hash_leaf(leaf)) for pos, leaf in zip(proof.positions, proof.leaves)]
+    assert all(a[0] < b[0] for a, b in zip(nodes, nodes[1:])), "Positions must be sorted and distinct"
+    assert 0 <= nodes[0][0] and nodes[-1][0] < 2 ** proof.height, "Position out of range"
+    hashes = deque(proof.hashes)
+    for level in range(proof.height):
+        parents = []
+        i = 0
+        while i < len(nodes):
+            pos, node = nodes[i]
+            if pos % 2 == 0 and i + 1 < len(nodes) and nodes[i + 1][0] == pos + 1:
+                left, right = node, nodes[i + 1][1]
+                i += 2
+            else:
+                assert hashes, "Multiproof is too short"
+                if pos % 2 == 0:
+                    left, right = node, hashes.popleft()
+                else:
+                    left, right = hashes.popleft(), node
+                i += 1
+            parents.append((pos >> 1, hash_internal_node(left, right)))
+        nodes = parents
+    assert not hashes, "Multiproof is too long"
+    return nodes[0][1]  # return the computed root
+
+
+def _verify_chunk(chunk):
+    """verifies a chunk of (leaf, pos, path, size, root) tuples.
+       A node that was authenticated under a root is remembered by
+       (level, index, hash), so later proofs through the same node stop there
+       once the rest of their path matches the one already checked."""
+    verified = {}  # (root, level, index, hash) -> path of the proof that authenticated the node
+    results = [None] * len(chunk)
+    hashes = hits = 0
+    for i in sorted(range(len(chunk)), key=lambda i: (chunk[i][4], chunk[i][1])):
+        leaf, pos, path, size, root = chunk[i]
+        if size is not None:
+            # path entries of unpadded proofs do not map to levels, so they are not memoized
+            results[i] = compute_merkle_root_from_proof(MerkleProof(leaf, pos, path, size)) == root
+            hashes += len(path) + 1
+            continue
+        node = hash_leaf(leaf)
+        hashes += 1
+        trail = []
+        for level in range(len(path) + 1):
+            key = (root, level, pos >> level, node)
+            seen = verified.get(key)
+            if seen is not None and seen[level:] == path[level:]:
+                hits += 1
+                ok = True
+                break
+            trail.append(key)
+            if level == len(path):
+                ok = node == root
+                break
+            if (pos >> level) % 2 == 0:
+                node = hash_internal_node(node, path[level])
+            else:
+                node = hash_internal_node(path[level], node)
+            hashes += 1
+        if ok:
+            for key in trail:
+                verified[key] = path
+        results[i] = ok
+    return results, hashes, hits
+
+
+def _bounded_map(pool, fn, items, window):
+    """like pool.map, but submits at most window items ahead of the result
+       being returned, so items are consumed as results come back."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def verify_merkle_proofs(proofs, roots, workers=None, chunk_size=4096):
+    """verifies each proof against the root at the same index in roots
+       (or against roots itself, if it is a single root).
+       Proofs are checked in chunks spread over a pool of worker processes,
+       at most two chunks per worker at a time, so proofs can be streamed
+       from a generator without being held in memory all at once.
+       Returns the list of pass/fail results and a dict of run statistics."""
+    if isinstance(roots, (bytes, bytearray, memoryview)):
+        roots = repeat(bytes(roots))  # e.g. the memoryview root of a MerkleNodeStore
+    # read_proofs and node stores give memoryviews, which cannot be sent to worker processes
+    items = ((bytes(proof.leaf), proof.pos, tuple(map(bytes, proof.path)), getattr(proof, "size", None), bytes(root))
+             for proof, root in zip(proofs, roots))
+    chunks = iter(lambda: list(islice(items, chunk_size)), [])
+
+    start = time.perf_counter()
+    results = []
+    hashes = hits = 0
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers) if workers != 1 else None  # workers=1 checks in this process
+    try:
+        outcomes = _bounded_map(pool, _verify_chunk, chunks, 2 * workers) if pool else map(_verify_chunk, chunks)
+        for chunk_results, chunk_hashes, chunk_hits in outcomes:
+            results += chunk_results
+            hashes += chunk_hashes
+            hits += chunk_hits
+    finally:
+        if pool:
+            pool.shutdown()
+    seconds = time.perf_counter() - start
+
+    passed = sum(results)
+    stats = {
+        "proofs": len(results),
+        "passed": passed,
+        "failed": len(results) - passed,
+        "hashes": hashes,
+        "memo_hits": hits,
+        "seconds": seconds,
+        "proofs_per_second": len(results) / seconds if seconds else 0.0,
+    }
+    return results, stats
+
+
+def compute_merkle_roots_from_consistency_proof(old_size, size, proof):
+    """computes the roots of the tree with old_size leaves and of the tree with
+       size leaves it grew into, from the given consistency proof.
+       Both roots are computed from the same old subtree hashes, so if they
+       match the committed roots, the old tree is a prefix of the new one."""
+    assert 0 < old_size <= size, "Tree size out of range"
+    empty = b"\x00"  # hash of a subtree that holds only padding, at the current level
+    hashes = deque(proof)
+    assert hashes, "Consistency proof is too short"
+    start = (old_size & -old_size).bit_length() - 1  # level of the first hash in the proof
+    index = (old_size - 1) >> start
+    old_height = (old_size - 1).bit_length()
+    old_root = root = hashes.popleft()
+    for level in range(start):
+        empty = hash_internal_node(empty, empty)
+    for level in range(start, (size - 1).bit_length()):
+        assert hashes, "Consistency proof is too short"
+        sibling = hashes.popleft()
+        if index % 2 == 1:
+            # the sibling is a complete subtree of old leaves, in both trees
+            if level < old_height:
+                old_root = hash_internal_node(sibling, old_root)
+            root = hash_internal_node(sibling, root)
+        else:
+            # the sibling holds only new leaves, which are padding in the old tree
+            if level < old_height:
+                old_root = hash_internal_node(old_root, empty)
+            root = hash_internal_node(root, sibling)
+        empty = hash_internal_node(empty, empty)
+        index >>= 1
+    assert not hashes, "Consistency proof is too long"
+    return old_root, root
+
+
 # Helper function
 def read_proof(filename):
     """Read the leaf data, position of leaf, and Merkle proof from file."""
     fp = open(filename, "r")
     pos = int(re.search('(\d*)$', fp.readline()).group(1))
     leaf = re.search('\"(.*)\"', fp.readline()).group(1).encode()
-    fp.readline()
+    size = None
+    line = fp.readline()
+    if line.startswith("unpadded tree size:"):
+        size = int(re.search('(\d*)$', line.rstrip()).group(1))
+        fp.readline()
     path = fp.readlines()
     for i in range(len(path)):
         path[i] = b64decode((path[i])[2:])
     fp.close()
-    return MerkleProof(leaf=leaf, pos=pos, path=path)
+    return MerkleProof(leaf=leaf, pos=pos, path=path, size=size)
+
+
+class ProofFile:
+    """The proofs of a binary proof file, as read by read_proofs.
+       The file is memory-mapped, and the leaves and hashes in the proofs are
+       memoryview slices of it, not copies. close() (or leaving a with block)
+       releases the mapping; proofs still referenced then keep it alive, and
+       it is unmapped once the last of them is released."""
+
+    def __init__(self, filename):
+        with open(filename, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+        magic, version = PROOF_HEADER.unpack_from(view)
+        assert magic == PROOF_MAGIC, "Not a binary proof file"
+        assert version in PROOF_RECORDS, "Unsupported proof file version"
+        record = PROOF_RECORDS[version]
+        count, index_offset = PROOF_FOOTER.unpack_from(view, len(view) - PROOF_FOOTER.size)
+
+        self.proofs = []
+        for i in range(count):
+            offset, = PROOF_OFFSET.unpack_from(view, index_offset + i * PROOF_OFFSET.size)
+            if version == 1:
+                pos, leaf_len, path_len = record.unpack_from(view, offset)
+                size = 0
+            else:
+                pos, size, leaf_len, path_len = record.unpack_from(view, offset)
+            offset += record.size
+            leaf = view[offset:offset + leaf_len]
+            offset += leaf_len
+            path = [view[offset + j * HASH_SIZE:offset + (j + 1) * HASH_SIZE] for j in range(path_len)]
+            path = [b"\x00" if node == PADDING_RECORD else node for node in path]
+            self.proofs.append(MerkleProof(leaf=leaf, pos=pos, path=path, size=size or None))
+
+    def __len__(self):
+        return len(self.proofs)
+
+    def __iter__(self):
+        return iter(self.proofs)
+
+    def __getitem__(self, i):
+        return self.proofs[i]
+
+    def close(self):
+        self.proofs = []
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # proofs handed out still point into the mapping; it is unmapped with the last of them
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_proofs(filename):
+    """Read all proofs from a binary proof file.
+       Returns a ProofFile, a sequence of the proofs to close when done."""
+    return ProofFile(filename)
 
 
 # Main program
@@ -78,17 +362,23 @@ if __name__ == "__main__":
     root = b64decode("1qIbsvuF6FrhNjMD4p06srUye6G4FfFINDDkNfKUpTs=")
     print('\nHave hardcoded root of committed Merkle tree.')
 
-    # Read (leaf data, position of leaf, and proof) from file
-    proof = read_proof(prooffile)
+    # Read (leaf data, position of leaf, and proof) from file, in either format
+    with open(prooffile, "rb") as fp:
+        binary = fp.read(len(PROOF_MAGIC)) == PROOF_MAGIC
+    proofs = read_proofs(prooffile) if binary else [read_proof(prooffile)]
 
-    # Verify that proof length is correct
-    height = len(proof.path)
-    assert height < MAX_HEIGHT, "Proof is too long"
+    for proof in proofs:
+        # Verify that proof length is correct
+        height = len(proof.path)
+        assert height < MAX_HEIGHT, "Proof is too long"
 
-    # Verify proof
-    computedRoot = compute_merkle_root_from_proof(proof)
-    assert root == computedRoot, "Verify failed"
+        # Verify proof
+        computedRoot = compute_merkle_root_from_proof(proof)
+        assert root == computedRoot, "Verify failed"
 
-    print('I verified the Merkle proof: leaf #{} in the committed tree is "{}".\n'.format(proof.pos,
-                                                                                          proof.leaf.decode("utf-8")))
+        print('I verified the Merkle proof: leaf #{} in the committed tree is "{}".'.format(
+            proof.pos, bytes(proof.leaf).decode("utf-8")))
+    if binary:
+        proofs.close()
+    print()
     sys.exit(0)
@@ -32,7 +32,7 @@ async def main():
     
     try:
         # Fetch and format tweets
-        tweets, screen_name, name = await tweetscout.fetch_user_tweets(args.handle)
+        tweets, screen_name, name = await tweetscout.get_user_tweets(args.handle)
         formatted_tweets = tweetscout.format_tweets(tweets)
         
         # Read system prompt template
@@ -58,6 +58,8 @@ async def main():
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        await tweetscout.http.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,15 +1,20 @@
+import os
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import AsyncGenerator
 
 import openai
-import requests
 from django.utils import timezone
 from pydantic import BaseModel
 
 # Initialize Django first
 from .django_setup import *  # noqa
-from .models import Agent, Chat, SystemPrompt
+from .http_client import AsyncHTTPClient, get_http_client
+from .models import Agent, Chat, SystemPrompt, TweetStore
+
+# Seconds a stored tweet fetch stays fresh enough to skip TweetScout entirely
+TWEET_STORE_TTL = float(os.getenv("TWEET_STORE_TTL", "3600"))
+TWEET_STORE_LIMIT = 1000  # tweets kept per handle
 
 
 class AgentPrompt(BaseModel):
@@ -19,14 +24,37 @@ class ChatMessage(BaseModel):
     handle: str
     message: str
     
+def tweet_id(tweet: dict) -> str:
+    return str(tweet.get('id_str') or tweet.get('id'))
+
+
+def tweet_sort_key(tweet: dict) -> int:
+    # Tweet ids are snowflakes, so they grow with the time of posting
+    value = tweet_id(tweet)
+    return int(value) if value.isdigit() else 0
+
+
 class TweetScoutAPI:
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        http: AsyncHTTPClient | None = None,
+        timeout: float | None = None,
+    ):
         self.api_key = api_key
+        # Shared keep-alive pool, so pages reuse connections across fetches
+        self.http = http or get_http_client()
+        self.timeout = timeout  # per-page timeout; None uses the client's
         
     async def fetch_user_tweets(
-        self, handle: str, count: int = 100
+        self, handle: str, count: int = 100, known_ids: set[str] | None = None
     ) -> tuple[list[dict], str, str]:
-        """Fetch tweets for a specific user using TweetScout API."""
+        """Fetch tweets for a specific user using TweetScout API.
+
+        With known_ids, only tweets not in it are returned, and paging stops
+        once a page ends in a known tweet and the new and known tweets
+        together make up count.
+        """
         url = "https://api.tweetscout.io/v2/user-tweets"
         headers = {
             "ApiKey": self.api_key,
@@ -38,6 +66,7 @@ class TweetScoutAPI:
             "link": f"https://twitter.com/{handle}",
         }
         
+        known_ids = known_ids or set()
         request_count = count // 20
         cursor = None
         tweets = []
@@ -46,18 +75,64 @@ class TweetScoutAPI:
             print(f"Fetching tweets for {handle}... {i+1}/{request_count}")
             if cursor is not None:
                 payload["cursor"] = cursor
-            response = requests.post(url, headers=headers, json=payload)
+            response = await self.http.post(
+                url, headers=headers, json=payload, timeout=self.timeout
+            )
             if response.status_code != 200:
                 msg = f"API request failed: {response.status_code}"
                 raise Exception(msg)
             data = response.json()
-            cursor = data['next_cursor']
+            cursor = data.get('next_cursor')
+            if not data['tweets']:
+                break
             if i == 0:
                 screen_name = data['tweets'][0]['user']['screen_name']
                 name = data['tweets'][0]['user']['name']
-            tweets.extend(data['tweets'])
+            tweets.extend(
+                tweet for tweet in data['tweets']
+                if tweet_id(tweet) not in known_ids
+            )
+            # A pinned tweet can be known while newer ones follow it, so only
+            # a page ending in a known tweet has caught up with the store
+            caught_up = tweet_id(data['tweets'][-1]) in known_ids
+            if not cursor or (caught_up and len(tweets) + len(known_ids) >= count):
+                break
             
         return tweets[:count], screen_name, name
+
+    async def get_user_tweets(
+        self, handle: str, count: int = 100, ttl: float | None = None
+    ) -> tuple[list[dict], str, str]:
+        """Return a user's latest tweets, fetching only what the TweetStore lacks.
+
+        A store fetched less than ttl seconds ago (TWEET_STORE_TTL by default)
+        is returned as is, even if it holds fewer than count tweets; otherwise
+        new tweets are fetched and merged in.
+        """
+        ttl = TWEET_STORE_TTL if ttl is None else ttl
+        store, _ = TweetStore.objects.get_or_create(handle=handle)
+        fresh = store.fetched_at is not None and (
+            timezone.now() - store.fetched_at
+        ) < timedelta(seconds=ttl)
+        if fresh:
+            return store.tweets[:count], store.screen_name, store.name
+
+        known_ids = {tweet_id(tweet) for tweet in store.tweets}
+        new_tweets, screen_name, name = await self.fetch_user_tweets(
+            handle, count, known_ids
+        )
+        # Tweets fetched past the store's oldest (and pinned ones) are older
+        # than some stored tweets, so merge by id to keep newest first
+        store.tweets = sorted(
+            new_tweets + store.tweets, key=tweet_sort_key, reverse=True
+        )[:TWEET_STORE_LIMIT]
+        if store.tweets:
+            store.newest_id = tweet_id(store.tweets[0])
+        store.screen_name = screen_name or store.screen_name
+        store.name = name or store.name
+        store.fetched_at = timezone.now()
+        store.save()
+        return store.tweets[:count], store.screen_name, store.name
         
     def format_tweets(self, tweets_data: list[dict]) -> list[str]:
         """Format tweets for character analysis."""
@@ -104,7 +179,7 @@ class TwitterAgent:
         """Generate an AI agent based on user's tweets."""
         try:
             # Fetch and format tweets
-            tweets, screen_name, name = await self.tweetscout.fetch_user_tweets(handle)
+            tweets, screen_name, name = await self.tweetscout.get_user_tweets(handle)
             formatted_tweets = self.tweetscout.format_tweets(tweets)
             
             # Generate character prompt
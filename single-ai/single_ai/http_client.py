@@ -0,0 +1,101 @@
+import asyncio
+import os
+import random
+
+import httpx
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class AsyncHTTPClient:
+    """Async HTTP client with one shared keep-alive connection pool.
+
+    Requests time out after `timeout` seconds unless a per-request timeout is
+    given. Responses with a 429 or 5xx status and transport errors are retried
+    up to `retries` times with jittered exponential backoff, honouring a
+    Retry-After header when the server sends one.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 10.0,
+    ):
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout, limits=self.limits
+            )
+        return self._client
+
+    def _delay(self, attempt: int, response: httpx.Response | None) -> float:
+        retry_after = response.headers.get("Retry-After") if response else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    async def request(
+        self, method: str, url: str, timeout: float | None = None, **kwargs
+    ) -> httpx.Response:
+        """Send a request, retrying rate limits, server errors and dropped
+        connections. Returns the last response, whatever its status."""
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            else:
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.retries
+                ):
+                    return response
+            await asyncio.sleep(self._delay(attempt, response))
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_http_client: AsyncHTTPClient | None = None
+
+
+def get_http_client() -> AsyncHTTPClient:
+    """Return the process-wide client, configured from the HTTP_* env variables."""
+    global _http_client
+    if _http_client is None:
+        _http_client = AsyncHTTPClient(
+            timeout=float(os.getenv("HTTP_TIMEOUT", "30")),
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(
+                os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10")
+            ),
+            retries=int(os.getenv("HTTP_RETRIES", "3")),
+        )
+    return _http_client
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('single_ai', '0002_systemprompt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetStore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('handle', models.CharField(db_index=True, max_length=255, unique=True)),
+                ('screen_name', models.CharField(blank=True, default='', max_length=255)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('tweets', models.JSONField(default=list)),
+                ('newest_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tweet Store',
+                'verbose_name_plural': 'Tweet Stores',
+                'db_table': '"single_ai"."tweet_stores"',
+            },
+        ),
+    ]
@@ -40,6 +40,24 @@ class Agent(models.Model):
         return f"{self.handle} ({self.status})"
 
 
+class TweetStore(models.Model):
+    handle = models.CharField(max_length=255, unique=True, db_index=True)
+    screen_name = models.CharField(max_length=255, blank=True, default='')
+    name = models.CharField(max_length=255, blank=True, default='')
+    # Raw TweetScout tweets, newest first; their ids tell a fetch where to stop
+    tweets = models.JSONField(default=list)
+    newest_id = models.CharField(max_length=64, null=True, blank=True)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = '"single_ai"."tweet_stores"'
+        verbose_name = 'Tweet Store'
+        verbose_name_plural = 'Tweet Stores'
+
+    def __str__(self):
+        return f"{self.handle} ({len(self.tweets)} tweets)"
+
+
 class Chat(models.Model):
     handle = models.CharField(max_length=255, db_index=True)
     message = models.TextField()
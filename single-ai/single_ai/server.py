@@ -1,4 +1,5 @@
 import os
+from contextlib import asynccontextmanager
 
 from django.utils import timezone
 from dotenv import load_dotenv
@@ -12,11 +13,20 @@ from .agent import (
     TwitterAgent as AIAgent,
 )
 from .django_setup import *  # noqa
+from .http_client import get_http_client
 from .models import Agent
 
 load_dotenv()
 
-app = FastAPI(title="Single AI Agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Close the pooled connections shared by all TweetScout fetches
+    await get_http_client().aclose()
+
+
+app = FastAPI(title="Single AI Agent", lifespan=lifespan)
 
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "*")
 origins = [origin.strip() for origin in allowed_origins.split(",")] \